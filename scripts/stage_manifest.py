@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+各处理步骤共用的增量清单（manifest）
+在输出目录中记录每个输入文件的内容哈希、处理参数、脚本版本和输出文件，
+再次运行时跳过内容没有变化、输出文件仍然存在的输入。
+脚本代码或参数（如清洗规则版本）改变时，旧记录全部失效，所有文件重新处理。
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+# 清单文件名：.manifest_<步骤名>.json，不会被各脚本的 *.txt / *.html 匹配到
+MANIFEST_PREFIX = ".manifest_"
+
+MANIFEST_FORMAT = 1
+
+
+def file_sha256(path):
+    """文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version(*paths):
+    """
+    脚本源码的哈希，用作步骤版本
+    代码有任何修改，之前的输出都视为过期
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            # 打包成exe时读不到源码，只能用文件名
+            digest.update(str(path).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class StageManifest:
+    """
+    一个处理步骤在某个输出目录中的清单
+    
+    用法:
+        manifest = StageManifest(output_dir, 'tieba_text_cleanerV2', version)
+        if manifest.is_current(key, [input_file]):
+            跳过
+        else:
+            处理并写出 output_file
+            manifest.record(key, output_file)
+        manifest.save()
+    """
+    
+    def __init__(self, output_dir, stage, version, params=None, force=False):
+        """
+        参数:
+            output_dir: 输出目录，清单保存在这里
+            stage: 步骤名
+            version: 步骤版本（一般为 code_version 的结果）
+            params: 影响输出的参数，与上次不同时所有记录失效
+            force: True 时忽略已有记录，全部重新处理
+        """
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / f"{MANIFEST_PREFIX}{stage}.json"
+        self.version = version
+        # 经过一次JSON转换，保证与读回的记录可以直接比较
+        self.params = json.loads(json.dumps(params or {}, ensure_ascii=False))
+        self.entries = {}
+        self.pending = {}
+        self.skipped = 0
+        # 因版本或参数变化而作废的记录数
+        self.invalidated = 0
+        if not force:
+            self.load()
+    
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        entries = data.get('entries', {})
+        if (data.get('format') != MANIFEST_FORMAT or data.get('version') != self.version
+                or data.get('params') != self.params):
+            self.invalidated = len(entries)
+            return
+        self.entries = entries
+    
+    def input_state(self, inputs, previous):
+        """
+        各输入文件的 {文件名: [大小, 修改时间, 哈希]}
+        大小和修改时间都没变时沿用上次的哈希，不必重新读取文件
+        """
+        state = {}
+        for path in inputs:
+            stat = os.stat(path)
+            name = Path(path).name
+            old = previous.get(name) if previous else None
+            if old and old[0] == stat.st_size and old[1] == stat.st_mtime_ns:
+                digest = old[2]
+            else:
+                digest = file_sha256(path)
+            state[name] = [stat.st_size, stat.st_mtime_ns, digest]
+        return state
+    
+    def is_current(self, key, inputs):
+        """
+        key 对应的输入是否与上次相同且输出仍然完好
+        
+        参数:
+            key: 输入的标识（一般为相对输入目录的路径）
+            inputs: 决定这个输出的所有输入文件（如帖子首页和各分页）
+        返回:
+            True 表示可以跳过；False 时处理完需调用 record
+        """
+        entry = self.entries.get(key)
+        state = self.input_state(inputs, entry['inputs'] if entry else None)
+        self.pending[key] = state
+        if entry is None:
+            return False
+        if {name: s[2] for name, s in state.items()} != {name: s[2] for name, s in entry['inputs'].items()}:
+            return False
+        
+        # 输出被删除或修改过也要重新生成
+        output = entry.get('output')
+        if output is not None:
+            output_file = self.output_dir / output
+            if not output_file.exists() or output_file.stat().st_size != entry.get('output_size'):
+                return False
+        
+        # 内容没变但修改时间变了（如重新复制），更新记录以便下次直接比较
+        entry['inputs'] = state
+        self.skipped += 1
+        return True
+    
+    def record(self, key, output=None):
+        """
+        记录 key 已处理完成
+        output: 输出文件；None 表示该输入没有输出（如404页面），下次同样跳过
+        """
+        entry = {'inputs': self.pending.pop(key), 'output': None}
+        if output is not None:
+            output = Path(output)
+            entry['output'] = Path(os.path.relpath(output, self.output_dir)).as_posix()
+            entry['output_size'] = output.stat().st_size
+        self.entries[key] = entry
+    
+    def save(self):
+        """写回清单（先写临时文件再替换，中断时不会留下损坏的清单）"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        data = {
+            'format': MANIFEST_FORMAT,
+            'version': self.version,
+            'params': self.params,
+            'entries': self.entries,
+        }
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+    
+    def summary(self):
+        """跳过情况的说明，没有跳过也没有作废时返回空字符串"""
+        if self.invalidated:
+            return f"脚本或参数已改变，{self.invalidated} 条旧记录作废，全部重新处理"
+        if self.skipped:
+            return f"跳过未变化: {self.skipped} 个文件"
+        return ""
+
+
+def for_script(output_dir, script_path, params=None, force=False, extra_sources=()):
+    """
+    以脚本文件名为步骤名、脚本源码哈希为版本，打开输出目录中的清单
+    extra_sources: 脚本依赖的其它源码文件，修改后同样使输出失效
+    """
+    script_path = Path(script_path)
+    version = code_version(script_path, *extra_sources)
+    return StageManifest(output_dir, script_path.stem, version, params, force)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+清洗规则的模糊测试和回溯基准测试
+1. 按每条规则的结构随机生成文本（含全角数字、各种空白、竖线等），确认清洗脚本的执行方式
+   （固定文字定位、RE2）与逐条 re.sub 的结果完全相同，把文本切成随机的几段分块清洗时结果也不变
+2. 为容易回溯的规则生成长串数字、「差一点就匹配」的重复片段、单行大文本等异常输入，
+   比较输入变长时 re 和清洗脚本实际执行方式的耗时增长
+"""
+
+import argparse
+import math
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import tieba_text_cleanerV2 as cleaner
+from tieba_text_cleanerV2 import sre_parse
+
+
+# 生成字符时 \d \s \w 的候选，特意包含 RE2 默认不认的非ASCII字符
+CATEGORY_SAMPLES = {
+    sre_parse.CATEGORY_DIGIT: '0123456789٣０',
+    sre_parse.CATEGORY_SPACE: ' \t\n　\xa0\x1c',
+    sre_parse.CATEGORY_WORD: 'aZ9_中ǅ٣',
+}
+
+# 随机插入的干扰字符
+NOISE = '0123456789٣０ \t\n　\xa0|，。!！中文aZ'
+
+DEFAULT_SIZES = (1000, 4000, 16000)
+
+# re 在某个长度上超过这个时间（秒）就不再测试更长的输入
+SLOW_LIMIT = 2.0
+
+
+def class_pool(items):
+    """字符类中可能出现的字符（取样）"""
+    pool = []
+    for op, value in items:
+        if op is sre_parse.LITERAL:
+            pool.append(chr(value))
+        elif op is sre_parse.RANGE:
+            pool.extend({chr(value[0]), chr(value[1]), chr((value[0] + value[1]) // 2)})
+        elif op is sre_parse.CATEGORY:
+            pool.extend(CATEGORY_SAMPLES.get(value, NOISE))
+    return pool
+
+
+def element_char(op, value, rng):
+    """生成一个能被单字符元素匹配的字符"""
+    if op is sre_parse.LITERAL:
+        return chr(value)
+    if op is sre_parse.IN:
+        if value and value[0][0] is sre_parse.NEGATE:
+            regex = re.compile('[' + ''.join(cleaner.char_class_items([(op, value[1:])]) or []) + ']')
+            pool = [c for c in NOISE if not regex.match(c)] or ['~']
+        else:
+            pool = class_pool(value) or ['~']
+        return rng.choice(pool)
+    return rng.choice(NOISE)
+
+
+def sample_match(ops, rng, run_length=None):
+    """
+    按语法树随机生成一段能匹配的文本
+    run_length: 不限次数的重复展开成这个长度（默认为 1~6）
+    """
+    parts = []
+    for op, value in ops:
+        if op in cleaner.REPEAT_OPS:
+            low, high, sub = value
+            if high == sre_parse.MAXREPEAT:
+                count = run_length if run_length else rng.randint(max(low, 1), max(low, 1) + 5)
+            else:
+                count = rng.randint(low, min(high, low + 3))
+            parts.extend(sample_match(sub, rng) for _ in range(count))
+        elif op is sre_parse.SUBPATTERN:
+            parts.append(sample_match(value[-1], rng, run_length))
+        elif op is sre_parse.BRANCH:
+            parts.append(sample_match(rng.choice(value[1]), rng, run_length))
+        elif op is sre_parse.AT:
+            continue
+        else:
+            parts.append(element_char(op, value, rng))
+    return ''.join(parts)
+
+
+def fuzz_text(parsed, rng):
+    """随机文本：完整匹配、被截断的匹配和干扰字符混在一起"""
+    pieces = []
+    for _ in range(rng.randint(1, 8)):
+        kind = rng.random()
+        sample = sample_match(parsed.data, rng)
+        if kind < 0.4:
+            pieces.append(sample)
+        elif kind < 0.7:
+            start = rng.randint(0, len(sample))
+            pieces.append(sample[start:start + rng.randint(0, len(sample))])
+        else:
+            pieces.append(''.join(rng.choice(NOISE) for _ in range(rng.randint(1, 6))))
+    return ''.join(pieces)
+
+
+def adversarial_inputs(parsed, size, rng):
+    """
+    容易引起回溯的输入，长度约为 size:
+      长串: 第一个不限次数的重复能匹配的字符连成一串（如一整行数字）
+      差一点: 去掉最后一部分、无法完成匹配的片段不断重复
+      单行: 完整匹配和差一点的片段用空格连成一行（模拟把空白压成一行的大页面）
+    """
+    inputs = {}
+    for op, value in parsed.data:
+        if op in cleaner.REPEAT_OPS and value[1] == sre_parse.MAXREPEAT:
+            unit = sample_match(value[2], rng)
+            inputs['长串'] = (unit * (size // max(len(unit), 1) + 1))[:size]
+            break
+    
+    near = sample_match(parsed.data[:-1], rng, run_length=8) if len(parsed.data) > 1 else ''
+    if near:
+        inputs['差一点'] = (near * (size // len(near) + 1))[:size]
+    
+    line = []
+    length = 0
+    while length < size:
+        piece = sample_match(parsed.data, rng) if rng.random() < 0.3 else near or sample_match(parsed.data, rng)
+        line.append(piece)
+        length += len(piece) + 1
+    inputs['单行'] = ' '.join(line)[:size]
+    return inputs
+
+
+def timed(func, text):
+    start = time.perf_counter()
+    func(text)
+    return time.perf_counter() - start
+
+
+def engine_name(rule):
+    if rule.linear is not None:
+        return 'RE2'
+    if rule.anchored:
+        return '文字定位'
+    return 're'
+
+
+def fuzz_rules(patterns, rounds, rng):
+    """逐条规则比较清洗脚本的结果和 re.sub，返回不一致的例子"""
+    mismatches = []
+    for index, rule in enumerate(patterns.rules, 1):
+        parsed = sre_parse.parse(rule.pattern)
+        regex = re.compile(rule.pattern)
+        for _ in range(rounds):
+            text = fuzz_text(parsed, rng)
+            expected = regex.subn(cleaner.REPLACEMENT, text)
+            if rule.replace(text) != expected:
+                mismatches.append((index, rule.pattern, text))
+                break
+    return mismatches
+
+
+def fuzz_engine(patterns, rounds, rng):
+    """把多条规则的片段拼在一起，比较整套规则的结果与逐条 re.sub"""
+    parsed = [sre_parse.parse(rule.pattern) for rule in patterns.rules]
+    mismatches = []
+    for _ in range(rounds):
+        text = ''.join(fuzz_text(rng.choice(parsed), rng) for _ in range(rng.randint(1, 6)))
+        expected = text
+        for rule in patterns.rules:
+            expected = re.sub(rule.pattern, cleaner.REPLACEMENT, expected)
+        expected = cleaner.PIPE_RUN_PATTERN.sub(cleaner.REPLACEMENT, expected)
+        if patterns.clean(text) != expected:
+            mismatches.append(text)
+    return mismatches
+
+
+def split_randomly(text, rng):
+    """把文本切成随机长度的几段，模拟分块读入"""
+    pieces = []
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, 16)
+        pieces.append(text[pos:pos + size])
+        pos += size
+    return pieces
+
+
+def fuzz_stream(patterns, rounds, rng):
+    """
+    把随机文本切成几段分块清洗，与清洗整个文本的结果比较
+    返回不一致的例子 [(规则序号, 输入)]，序号为 None 的是整套规则
+    """
+    mismatches = []
+    parsed = [sre_parse.parse(rule.pattern) for rule in patterns.rules]
+    for index, rule in enumerate(patterns.rules, 1):
+        for _ in range(rounds):
+            text = fuzz_text(parsed[index - 1], rng)
+            stage = cleaner.StreamStage(rule)
+            result = ''.join(stage.feed(piece) for piece in split_randomly(text, rng)) + stage.feed('', final=True)
+            if result != rule.replace(text)[0]:
+                mismatches.append((index, text))
+                break
+    
+    for _ in range(rounds):
+        text = ''.join(fuzz_text(rng.choice(parsed), rng) for _ in range(rng.randint(1, 6)))
+        if ''.join(patterns.clean_stream(split_randomly(text, rng))) != patterns.clean(text):
+            mismatches.append((None, text))
+    return mismatches
+
+
+def growth_exponent(times, sizes):
+    """最后两个测到的长度之间耗时的增长指数（1 为线性，2 为平方），测不到时返回 None"""
+    measured = [(t, n) for t, n in zip(times, sizes) if t is not None]
+    if len(measured) < 2 or measured[-2][0] <= 0 or measured[-1][0] < 0.001:
+        return None
+    (t1, n1), (t2, n2) = measured[-2:]
+    return math.log(t2 / t1) / math.log(n2 / n1)
+
+
+def benchmark_rules(patterns, sizes, rng, everything=False):
+    """
+    对容易回溯的规则（everything 为 True 时所有规则）输入异常文本，
+    打印各长度下 re 的耗时、实际执行方式在最长输入上的耗时，以及两者的增长指数
+    返回: [(序号, 输入名, re 增长指数, 实际增长指数, 执行方式)]，只含 re 超线性增长的
+    """
+    print(f"{'序号':>4} {'执行方式':<8}{'输入':<6}" + ''.join(f"{'re ' + str(n):>12}" for n in sizes)
+          + f"{'实际 ' + str(sizes[-1]):>14}{'re增长':>8}{'实际增长':>8}  规则")
+    flagged = []
+    for index, rule in enumerate(patterns.rules, 1):
+        if not (everything or rule.analysis.get('backtracking')):
+            continue
+        parsed = sre_parse.parse(rule.pattern)
+        regex = re.compile(rule.pattern)
+        cases = {}
+        for size in sizes:
+            for name, text in adversarial_inputs(parsed, size, rng).items():
+                cases.setdefault(name, []).append(text)
+        
+        for name, texts in cases.items():
+            re_times = []
+            actual_times = []
+            for text in texts:
+                if re_times and (re_times[-1] is None or re_times[-1] > SLOW_LIMIT):
+                    re_times.append(None)
+                else:
+                    re_times.append(timed(lambda t: regex.subn(cleaner.REPLACEMENT, t), text))
+                if actual_times and (actual_times[-1] is None or actual_times[-1] > SLOW_LIMIT):
+                    actual_times.append(None)
+                else:
+                    actual_times.append(timed(rule.replace, text))
+            
+            re_growth = growth_exponent(re_times, sizes)
+            actual_growth = growth_exponent(actual_times, sizes)
+            columns = ''.join(f"{t * 1000:>10.1f}ms" if t is not None else f"{'跳过':>12}" for t in re_times)
+            actual = f"{actual_times[-1] * 1000:>12.1f}ms" if actual_times[-1] is not None else f"{'跳过':>14}"
+            growth = ''.join(f"{g:>8.1f}" if g is not None else f"{'-':>8}" for g in (re_growth, actual_growth))
+            print(f"{index:>4} {engine_name(rule):<8}{name:<6}{columns}{actual}{growth}  {rule.pattern[:40]}")
+            if re_growth is not None and re_growth > 1.5:
+                flagged.append((index, name, re_growth, actual_growth, engine_name(rule)))
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='清洗规则的模糊测试和回溯基准测试')
+    parser.add_argument('--rounds', type=int, default=300, help='每条规则的随机文本数 (默认: 300)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help=f"异常输入的长度 (默认: {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument('--seed', type=int, default=1, help='随机种子 (默认: 1)')
+    parser.add_argument('--all', action='store_true', help='基准测试所有规则，而不只是容易回溯的规则')
+    parser.add_argument('--skip-benchmark', action='store_true', help='只做模糊测试')
+    args = parser.parse_args()
+    
+    print("=" * 60)
+    print("清洗规则模糊测试 / 回溯基准测试")
+    print("=" * 60)
+    rng = random.Random(args.seed)
+    patterns = cleaner.load_rules()
+    print(f"✓ 已加载 {len(patterns)} 个替换规则: {'，'.join(patterns.sources)}")
+    print(f"✓ RE2: {'已安装' if cleaner.re2 else '未安装（容易回溯的规则用 re 执行，靠时间预算防止卡住）'}")
+    print()
+    
+    mismatches = fuzz_rules(patterns, args.rounds, rng)
+    engine_mismatches = fuzz_engine(patterns, args.rounds, rng)
+    stream_mismatches = fuzz_stream(patterns, args.rounds, rng)
+    print(f"模糊测试: 每条规则 {args.rounds} 个随机文本，整套规则 {args.rounds} 个")
+    for index, pattern, text in mismatches:
+        print(f"  ✗ 规则 #{index} 与 re.sub 不同: {pattern[:40]}  输入: {text[:80]!r}")
+    for text in engine_mismatches[:5]:
+        print(f"  ✗ 整套规则与逐条 re.sub 不同，输入: {text[:80]!r}")
+    for index, text in stream_mismatches[:5]:
+        target = f"规则 #{index}" if index else "整套规则"
+        print(f"  ✗ {target}分块清洗与整个清洗不同，输入: {text[:80]!r}")
+    if not mismatches and not engine_mismatches:
+        print("  ✓ 结果与逐条 re.sub 完全相同")
+    if not stream_mismatches:
+        print("  ✓ 分块清洗与整个清洗结果完全相同")
+    
+    if not args.skip_benchmark:
+        print()
+        flagged = benchmark_rules(patterns, sorted(args.sizes), rng, args.all)
+        print()
+        if flagged:
+            print("re 耗时超线性增长（增长指数 > 1.5）的规则:")
+            for index, name, re_growth, actual_growth, engine in flagged:
+                if actual_growth is not None and actual_growth > 1.5:
+                    result = f"实际执行方式（{engine}）同样超线性，清洗时靠时间预算跳过"
+                else:
+                    result = f"实际执行方式（{engine}）没有超线性增长"
+                print(f"  #{index} 输入「{name}」增长指数 {re_growth:.1f}，{result}")
+        else:
+            print("✓ 没有发现超线性增长的规则")
+    
+    if mismatches or engine_mismatches or stream_mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,69 @@
 作者：Claude
 """
 
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
 import re
+import sys
+import time
 from pathlib import Path
 
+# 各步骤共用的增量清单 scripts/stage_manifest.py；单独复制本脚本时没有它，每次全部处理
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+try:
+    import stage_manifest
+except ImportError:
+    stage_manifest = None
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    # Python 3.10 及以前
+    import sre_parse
+
+# 可选：线性时间的正则引擎（pip install google-re2），用于执行容易回溯的规则
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# 匹配到的内容统一替换成的字符
+REPLACEMENT = "|"
+
+# 连续的竖线
+PIPE_RUN_PATTERN = re.compile(r'\|+')
+
+# 规则文件目录：其中每个 *.json 是一个规则文件，按文件名顺序加载（格式见 rules/README.md）
+RULES_DIR = Path(__file__).resolve().parent / "rules"
+RULE_FILE_FORMAT = 1
+
+# 规则分析结果的缓存，保存在规则目录中；内置规则、规则文件或下面的版本号改变时失效
+RULE_CACHE_NAME = ".compiled_rules.json"
+RULE_CACHE_FORMAT = 4
+
+# 内置规则的来源名（规则文件的规则以文件名为来源）
+BUILTIN_SOURCE = "内置"
+
+# 帖子TXT第一行「标题: ...【XX吧】_百度贴吧」中的吧名，用于带作用范围的规则
+BAR_PATTERN = re.compile(r'标题: [^\n]*【([^【】\n]+?)吧】')
+
+# 时间预算（秒）：单条规则在一个文件上超过 RULE_TIMEOUT 时跳过这条规则，
+# 整个文件超过 FILE_TIMEOUT 时放弃这个文件；0 表示不限制
+RULE_TIMEOUT = 10
+FILE_TIMEOUT = 120
+
+# 等待清洗子进程时检查进度的间隔（秒）
+SANDBOX_POLL_INTERVAL = 0.05
+
+# 分块清洗：超过 STREAM_THRESHOLD 字节的文件每次读入 STREAM_CHUNK_SIZE 个字符，
+# 内存占用不随文件大小增长，结果与整个读入时完全相同
+STREAM_THRESHOLD = 64 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+
 def create_replacement_patterns():
     """
     创建替换模式列表
@@ -112,7 +171,7 @@ def create_replacement_patterns():
         "1 2 ",
         "◆◆",
         "游戏 ",
-
+        
         # 广告相关
         "广告",
         "不感兴趣",
@@ -227,34 +286,872 @@ def create_replacement_patterns():
     
     return all_patterns
 
-def clean_text(text, patterns):
+def required_literal(parsed):
+    """
+    求正则的每个匹配都必然包含的一段固定文字
+    只看最外层连续的普通字符（分支、重复中的字符不一定出现），取最长的一段
+    
+    参数:
+        parsed: sre_parse.parse 的结果
+    返回:
+        (文字, 它在最外层的起始位置)；没有固定文字时返回 ('', 0)
+    """
+    best = ('', 0)
+    run = ''
+    for i, (op, value) in enumerate(parsed):
+        if op is sre_parse.LITERAL:
+            run += chr(value)
+            if len(run) > len(best[0]):
+                best = (run, i + 1 - len(run))
+        else:
+            run = ''
+    return best
+
+CATEGORY_CLASSES = {
+    sre_parse.CATEGORY_DIGIT: r'\d',
+    sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s',
+    sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w',
+    sre_parse.CATEGORY_NOT_WORD: r'\W',
+}
+
+REPEAT_OPS = tuple(op for op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT,
+                                 getattr(sre_parse, 'POSSESSIVE_REPEAT', None)) if op is not None)
+
+def char_class_items(ops):
+    """
+    一段正则可能匹配的所有单个字符，写成字符类 [...] 中的各项
+    含断言、反向引用、任意字符、取反字符类等无法这样列出的内容时返回 None
+    """
+    items = []
+    for op, value in ops:
+        if op is sre_parse.LITERAL:
+            items.append(re.escape(chr(value)))
+        elif op is sre_parse.IN:
+            for item_op, item in value:
+                if item_op is sre_parse.LITERAL:
+                    items.append(re.escape(chr(item)))
+                elif item_op is sre_parse.RANGE:
+                    items.append(re.escape(chr(item[0])) + '-' + re.escape(chr(item[1])))
+                elif item_op is sre_parse.CATEGORY and item in CATEGORY_CLASSES:
+                    items.append(CATEGORY_CLASSES[item])
+                else:
+                    return None
+        elif op in REPEAT_OPS:
+            sub = char_class_items(value[2])
+            if sub is None:
+                return None
+            items.extend(sub)
+        elif op is sre_parse.SUBPATTERN:
+            sub = char_class_items(value[-1])
+            if sub is None:
+                return None
+            items.extend(sub)
+        elif op is sre_parse.BRANCH:
+            for branch in value[1]:
+                sub = char_class_items(branch)
+                if sub is None:
+                    return None
+                items.extend(sub)
+        else:
+            return None
+    return items
+
+def consumed_items(ops):
+    """
+    一段正则可能匹配的字符，分为可以并入一个字符类 [...] 的各项，和取反字符类、任意字符等单独的项
+    含断言、反向引用、局部标志等与前后文字有关的内容时返回 None
+    """
+    positive = []
+    others = []
+    for op, value in ops:
+        if op is sre_parse.LITERAL:
+            positive.append(re.escape(chr(value)))
+        elif op is sre_parse.NOT_LITERAL:
+            others.append('[^' + re.escape(chr(value)) + ']')
+        elif op is sre_parse.ANY:
+            others.append('.')
+        elif op is sre_parse.IN:
+            negate = bool(value) and value[0][0] is sre_parse.NEGATE
+            items = char_class_items([(op, value[1:] if negate else value)])
+            if items is None:
+                return None
+            if negate:
+                others.append('[^' + ''.join(items) + ']')
+            else:
+                positive.extend(items)
+        else:
+            if op in REPEAT_OPS:
+                subs = [value[2]]
+            elif op is sre_parse.SUBPATTERN and not value[1] and not value[2]:
+                subs = [value[-1]]
+            elif op is sre_parse.BRANCH:
+                subs = value[1]
+            else:
+                return None
+            for sub in subs:
+                result = consumed_items(sub)
+                if result is None:
+                    return None
+                positive.extend(result[0])
+                others.extend(result[1])
+    return positive, others
+
+def stop_class(parsed):
+    """
+    匹配规则永远不会匹配的单个字符（停止字符）的正则，如关键词规则中不在关键词里的字
+    任何匹配都不会跨过停止字符，分块清洗时在这里切开（见 StreamStage）
+    规则可能匹配空串、或含断言等列不出字符的内容时返回 None
+    """
+    if parsed.getwidth()[0] == 0:
+        return None
+    result = consumed_items(parsed.data)
+    if result is None:
+        return None
+    positive, others = result
+    if not others:
+        stop = '[^' + ''.join(positive) + ']'
+    else:
+        parts = (['[' + ''.join(positive) + ']'] if positive else []) + others
+        stop = '(?!' + '|'.join(parts) + ')(?s:.)'
+    flags = ''.join(letter for flag, letter in ((re.IGNORECASE, 'i'), (re.DOTALL, 's'), (re.ASCII, 'a'))
+                    if parsed.state.flags & flag)
+    return f'(?{flags}:{stop})' if flags else stop
+
+def analyze_pattern(pattern):
+    """
+    分析正则的结构，决定 ReplacementRule 的查找方式
+    返回可以直接保存为JSON的字典
+    """
+    parsed = sre_parse.parse(pattern)
+    literal, start = required_literal(parsed)
+    analysis = {'literal': literal, 'anchored': False}
+    
+    # 匹配起点到固定文字之间的前缀：长度范围，以及它能包含的字符
+    if (literal and parsed.data[0][0] is not sre_parse.LITERAL
+            and not parsed.state.flags & re.IGNORECASE):
+        prefix = sre_parse.SubPattern(parsed.state, parsed.data[:start])
+        min_prefix, max_prefix = prefix.getwidth()
+        items = char_class_items(prefix)
+        analysis['min_prefix'] = min_prefix
+        analysis['max_prefix'] = None if max_prefix >= sre_parse.MAXREPEAT - 1 else max_prefix
+        analysis['prefix_class'] = '[' + ''.join(items) + ']' if items else None
+        # 前缀长度无限又列不出字符时，找不到起点的范围
+        analysis['anchored'] = analysis['max_prefix'] is not None or analysis['prefix_class'] is not None
+    
+    # 以固定文字开头的规则只在这段文字处尝试匹配，不会在长串数字上逐个位置回溯
+    analysis['backtracking'] = (parsed.data[0][0] is not sre_parse.LITERAL
+                                and has_backtracking_repeat(parsed.data))
+    analysis['stop_class'] = stop_class(parsed)
+    return analysis
+
+def has_backtracking_repeat(ops, followed=False, nested=False):
+    """
+    是否有不限次数的重复后面还跟着别的内容（或套在另一个重复里），如 \\d+[...]{5,60}\\d{5,}
+    匹配失败时 re 会逐个退回重复过的字符再试，在长串数字、单行的大文件上耗时成倍增长
+    """
+    for i, (op, value) in enumerate(ops):
+        rest = followed or i < len(ops) - 1
+        if op in REPEAT_OPS:
+            if value[1] == sre_parse.MAXREPEAT and (rest or nested):
+                return True
+            if has_backtracking_repeat(value[2], rest, True):
+                return True
+        elif op is sre_parse.SUBPATTERN:
+            if has_backtracking_repeat(value[-1], rest, nested):
+                return True
+        elif op is sre_parse.BRANCH:
+            if any(has_backtracking_repeat(branch, rest, nested) for branch in value[1]):
+                return True
+    return False
+
+# RE2 的 \d \s \w 只匹配ASCII字符，翻译时换成 re 实际匹配的全部字符范围（第一次用到时计算）
+_category_ranges = {}
+
+def category_ranges(category):
+    """re 中 \\d \\D \\s \\S \\w \\W 匹配的字符，写成 RE2 字符类中的若干范围"""
+    if not _category_ranges:
+        # 所有字符排成一串，连续匹配的一段就是一个范围；RE2 不接受代理区的字符
+        # 这串字符有一百多万个，六类一次算完后就不再保留
+        all_chars = ''.join(map(chr, range(sys.maxunicode + 1)))
+        computed = {}
+        for item, char_class in CATEGORY_CLASSES.items():
+            ranges = []
+            for match in re.finditer(char_class + '+', all_chars):
+                first, last = match.start(), match.end() - 1
+                for low, high in ((first, min(last, 0xD7FF)), (max(first, 0xE000), last)):
+                    if low <= high:
+                        ranges.append(re2_char(low) + ('-' + re2_char(high) if high > low else ''))
+            computed[item] = ''.join(ranges)
+        # 全部算完再放入缓存，其它线程不会看到只有一部分的结果
+        _category_ranges.update(computed)
+    return _category_ranges[category]
+
+def re2_char(code):
+    return '\\x{%x}' % code
+
+def re2_class(items):
+    """把 re 的字符类翻译成 RE2 写法，无法翻译时返回 None"""
+    parts = []
+    negate = False
+    for op, value in items:
+        if op is sre_parse.NEGATE:
+            negate = True
+        elif op is sre_parse.LITERAL:
+            parts.append(re2_char(value))
+        elif op is sre_parse.RANGE:
+            parts.append(re2_char(value[0]) + '-' + re2_char(value[1]))
+        elif op is sre_parse.CATEGORY and value in CATEGORY_CLASSES:
+            parts.append(category_ranges(value))
+        else:
+            return None
+    return '[' + ('^' if negate else '') + ''.join(parts) + ']'
+
+def re2_translate(ops):
+    """
+    把 re 的语法树翻译成匹配结果完全相同的 RE2 正则
+    含反向引用、前后断言、\b、$ 等 RE2 不支持或含义不同的内容时返回 None
+    """
+    parts = []
+    for op, value in ops:
+        if op is sre_parse.LITERAL:
+            parts.append(re2_char(value))
+        elif op is sre_parse.NOT_LITERAL:
+            parts.append('[^' + re2_char(value) + ']')
+        elif op is sre_parse.ANY:
+            # 两者的 . 都不匹配换行
+            parts.append('.')
+        elif op is sre_parse.IN:
+            part = re2_class(value)
+            if part is None:
+                return None
+            parts.append(part)
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, high, sub = value
+            inner = re2_translate(sub)
+            # RE2 的重复次数最多1000
+            if inner is None or low > 1000 or (high != sre_parse.MAXREPEAT and high > 1000):
+                return None
+            if high == sre_parse.MAXREPEAT:
+                quantifier = '*' if low == 0 else '+' if low == 1 else '{%d,}' % low
+            else:
+                quantifier = '{%d}' % low if low == high else '{%d,%d}' % (low, high)
+            parts.append('(?:' + inner + ')' + quantifier + ('?' if op is sre_parse.MIN_REPEAT else ''))
+        elif op is sre_parse.SUBPATTERN:
+            # 替换成固定字符，分组本身不影响结果；分组内改变标志的不翻译
+            if value[1] or value[2]:
+                return None
+            inner = re2_translate(value[-1])
+            if inner is None:
+                return None
+            parts.append('(?:' + inner + ')')
+        elif op is sre_parse.BRANCH:
+            branches = [re2_translate(branch) for branch in value[1]]
+            if None in branches:
+                return None
+            parts.append('(?:' + '|'.join(branches) + ')')
+        elif op is sre_parse.AT and value in (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING):
+            # 没有 re.MULTILINE 时 ^ 只匹配开头
+            parts.append('\\A')
+        elif op is sre_parse.AT and value is sre_parse.AT_END_STRING:
+            parts.append('\\z')
+        else:
+            return None
+    return ''.join(parts)
+
+def compile_re2(pattern):
+    """
+    用 RE2 编译正则，结果与 re 完全相同；未安装 re2 或无法等价翻译时返回 None
+    能匹配空字符串的规则不翻译（两者对空匹配的处理不同）
+    """
+    if re2 is None:
+        return None
+    parsed = sre_parse.parse(pattern)
+    if parsed.state.flags & ~re.UNICODE or parsed.getwidth()[0] == 0:
+        return None
+    translated = re2_translate(parsed.data)
+    if translated is None:
+        return None
+    try:
+        return re2.compile(translated)
+    except re2.error:
+        return None
+
+class ReplacementRule:
+    """
+    一条编译好的替换规则，replace 的结果与 re.sub(pattern, '|', text) 相同
+    
+    以固定文字开头的规则（包括所有关键词）直接用 re.sub，re 会先快速查找开头的文字；
+    像 r'\\d+回复贴，共\\d+页' 这样固定文字前面还有 \\d+ 等内容的规则，re.sub 要在每个位置
+    都试一次前缀，这里改为先用 str.find 找固定文字，再只在它前面可能的起点上尝试匹配
+    """
+    
+    def __init__(self, pattern, scope=None, analysis=None, source=BUILTIN_SOURCE):
+        """
+        参数:
+            pattern: 正则表达式
+            scope: 只作用于这些吧（不带「吧」字）的帖子；None 表示所有帖子
+            analysis: 缓存中的 analyze_pattern 结果，没有时现场分析
+            source: 规则来源（内置或规则文件名），用于 --profile-rules 报告
+        """
+        self.pattern = pattern
+        self.source = source
+        self.scope = frozenset(scope) if scope else None
+        self.analysis = analysis or analyze_pattern(pattern)
+        self.literal = self.analysis['literal']
+        self.anchored = self.analysis['anchored']
+        if self.anchored:
+            self.min_prefix = self.analysis['min_prefix']
+            self.max_prefix = self.analysis['max_prefix']
+        # 第一次使用时才编译，从缓存加载大量规则时启动不必等待编译
+        self._regex = None
+        self._prefix_char = None
+        self._last_stop = None
+        self._linear = None
+        self.linear_checked = False
+    
+    @property
+    def regex(self):
+        if self._regex is None:
+            self._regex = re.compile(self.pattern)
+        return self._regex
+    
+    @property
+    def linear(self):
+        """容易回溯的规则在安装了 re2 时改用 RE2 执行（线性时间），否则为 None"""
+        if not self.linear_checked:
+            self.linear_checked = True
+            if self.analysis.get('backtracking'):
+                self._linear = compile_re2(self.pattern)
+        return self._linear
+    
+    def compile(self):
+        """立即编译这条规则用到的全部正则（统计耗时之前调用，编译时间不算到第一次匹配上）"""
+        self.regex
+        self.linear
+        self.prefix_char
+        self.last_stop
+    
+    @property
+    def prefix_char(self):
+        if self._prefix_char is None and self.analysis.get('prefix_class'):
+            self._prefix_char = re.compile(self.analysis['prefix_class'])
+        return self._prefix_char
+    
+    @property
+    def last_stop(self):
+        """从某个位置开始匹配到最后一个停止字符为止；列不出停止字符时为 None"""
+        if self._last_stop is None and self.analysis.get('stop_class'):
+            self._last_stop = re.compile(r'(?s:.*)' + self.analysis['stop_class'])
+        return self._last_stop
+    
+    def applies_to(self, bar):
+        return self.scope is None or bar in self.scope
+    
+    def to_cache(self):
+        return {'pattern': self.pattern, 'scope': sorted(self.scope) if self.scope else None,
+                'analysis': self.analysis, 'source': self.source}
+    
+    def replace(self, text):
+        """返回 (替换后的文本, 替换次数)，与 re.subn 相同"""
+        linear = self.linear
+        if linear is not None:
+            if self.literal and self.literal not in text:
+                return text, 0
+            return linear.subn(REPLACEMENT, text)
+        if not self.anchored:
+            return self.regex.subn(REPLACEMENT, text)
+        
+        literal = self.literal
+        match_at = self.regex.match
+        prefix_char = self.prefix_char
+        pieces = []
+        pos = 0
+        found = text.find(literal)
+        while found != -1:
+            # 使用这处固定文字的匹配，起点在 [lowest, highest] 之间，且前缀中的字符都属于前缀字符类；
+            # 更靠后的固定文字对应的起点也不会比 lowest 更靠前，所以按顺序尝试得到的就是最左边的匹配
+            highest = found - self.min_prefix
+            lowest = pos if self.max_prefix is None else max(pos, found - self.max_prefix)
+            if prefix_char is not None:
+                start = found
+                while start > lowest and prefix_char.match(text, start - 1):
+                    start -= 1
+                lowest = start
+            match = None
+            for start in range(lowest, highest + 1):
+                match = match_at(text, start)
+                if match:
+                    break
+            if match:
+                pieces.append(text[pos:match.start()])
+                pieces.append(REPLACEMENT)
+                pos = match.end()
+                found = text.find(literal, max(pos, found + 1))
+            else:
+                found = text.find(literal, found + 1)
+        
+        if not pieces:
+            return text, 0
+        count = len(pieces) // 2
+        pieces.append(text[pos:])
+        return ''.join(pieces), count
+
+class StreamStage:
+    """
+    分块清洗时一条规则的执行状态，依次送入的各段文本的结果拼起来与对整个文本执行 rule.replace 相同
+    
+    规则的匹配不会包含停止字符（见 stop_class），所以每段文本在最后一个停止字符之后切开：
+    前面的部分（连同之前留下的文本）立即替换，交给下一条规则；后面的部分留下来与下一段拼接。
+    留下的只是最后一个停止字符之后的一小段，像 \\d+ 这样长度不限的匹配跨过分块边界也能正确处理；
+    列不出停止字符的规则保留所有文本，到文件末尾再执行
+    """
+    
+    def __init__(self, rule):
+        self.rule = rule
+        self.carry = []
+    
+    def cut(self, piece):
+        """piece 中最后一个停止字符之后的位置，没有停止字符时返回 0"""
+        last_stop = self.rule.last_stop
+        if last_stop is None:
+            return 0
+        # 从末尾附近开始找，找不到再逐步扩大范围，不必每次从头扫描整段文本
+        probe = 256
+        start = len(piece)
+        while start > 0:
+            start = max(0, len(piece) - probe)
+            match = last_stop.match(piece, start)
+            if match:
+                return match.end()
+            probe *= 4
+        return 0
+    
+    def feed(self, piece, final=False):
+        """
+        送入下一段文本，返回可以交给下一条规则的部分（可能为空）
+        final: 文件已读完，替换并返回留下的所有文本
+        """
+        rest = ''
+        if not final:
+            cut = self.cut(piece)
+            if not cut:
+                self.carry.append(piece)
+                return ''
+            piece, rest = piece[:cut], piece[cut:]
+        self.carry.append(piece)
+        text = ''.join(self.carry)
+        self.carry = [rest] if rest else []
+        return self.rule.replace(text)[0]
+
+class ReplacementEngine:
+    """
+    编译好的一组替换规则，结果与按顺序逐条 re.sub(pattern, '|', text) 完全相同
+    每条规则只编译一次，并按它的结构选择更快的查找方式（见 ReplacementRule）
+    """
+    
+    def __init__(self, rules, version="", sources=()):
+        """
+        参数:
+            rules: 正则表达式或 ReplacementRule 的列表，按执行顺序排列
+            version: 规则集的版本，记录到增量清单中，规则改变时输出重新生成
+            sources: 规则来源的说明（内置规则、各规则文件）
+        """
+        self.rules = [rule if isinstance(rule, ReplacementRule) else ReplacementRule(rule)
+                      for rule in rules]
+        self.version = version
+        self.sources = list(sources)
+        self.scoped = any(rule.scope for rule in self.rules)
+        # 最后清理连续的竖线，分块清洗时与其它规则一样逐段执行
+        self.pipe_run = ReplacementRule(PIPE_RUN_PATTERN.pattern)
+    
+    def __len__(self):
+        return len(self.rules)
+    
+    def clean(self, text, bar=None, stats=None, skip=(), progress=None):
+        """
+        参数:
+            text: 要清理的文本
+            bar: 帖子所在的吧；None 时从文本的标题行中读取（只影响带作用范围的规则）
+            stats: new_stats() 的结果，传入时累计每条规则的匹配次数、删除字节数和耗时
+            skip: 不执行的规则序号（超时被跳过的规则）
+            progress: 共享的整数（multiprocessing.Value），执行每条规则前写入它的序号，
+                      供 RuleSandbox 判断是哪条规则超时（分块清洗时见 clean_stream）
+        """
+        if self.scoped and bar is None:
+            bar = detect_bar(text)
+        for i, rule in enumerate(self.rules):
+            if not rule.applies_to(bar) or i in skip:
+                continue
+            if progress is not None:
+                progress.value = i
+            if stats is None:
+                text = rule.replace(text)[0]
+                continue
+            
+            start = time.perf_counter()
+            new_text, count = rule.replace(text)
+            stat = stats[i]
+            stat['time'] += time.perf_counter() - start
+            stat['files'] += 1
+            if count:
+                stat['matches'] += count
+                stat['bytes_removed'] += len(text.encode('utf-8')) - len(new_text.encode('utf-8'))
+            text = new_text
+        
+        # 清理连续的竖线（可选，保持整洁）
+        return PIPE_RUN_PATTERN.sub(REPLACEMENT, text)
+    
+    def clean_stream(self, chunks, bar=None, skip=(), progress=None):
+        """
+        分块清洗，依次返回清洗结果的各段，拼起来与 clean(''.join(chunks)) 完全相同
+        每条规则一个 StreamStage，每段文本依次经过各条规则，只有各规则留下的一小段留在内存中
+        
+        参数:
+            chunks: 依次读入的各段文本（如 iter(lambda: f.read(STREAM_CHUNK_SIZE), '')）
+            bar, skip: 同 clean
+            progress: 同 clean；同一条规则在各段上分多次执行，每次写入 规则序号 + 执行次数 × 规则数，
+                      RuleSandbox 据此区分不同的执行、用余数找到规则
+        """
+        chunks = iter(chunks)
+        head = []
+        if self.scoped and bar is None:
+            # 吧名在第一行，读到第一个换行再判断
+            for chunk in chunks:
+                head.append(chunk)
+                if '\n' in chunk:
+                    break
+            bar = detect_bar(''.join(head))
+        stages = [(i, StreamStage(rule)) for i, rule in enumerate(self.rules)
+                  if rule.applies_to(bar) and i not in skip]
+        stages.append((None, StreamStage(self.pipe_run)))
+        
+        pieces = itertools.chain(head, chunks)
+        calls = 0
+        final = False
+        while not final:
+            piece = next(pieces, None)
+            # 读完后再送一次空文本，让各规则处理留下的部分
+            final = piece is None
+            if final:
+                piece = ''
+            for i, stage in stages:
+                if progress is not None and i is not None:
+                    progress.value = i + calls * len(self.rules)
+                    calls += 1
+                piece = stage.feed(piece, final)
+                if not piece and not final:
+                    break
+            if piece:
+                yield piece
+    
+    def new_stats(self):
+        """每条规则一个统计项，供 clean(stats=...) 累计"""
+        return [{'matches': 0, 'bytes_removed': 0, 'time': 0.0, 'files': 0} for _ in self.rules]
+
+def sandbox_worker(rules_dir, conn, progress):
+    """
+    RuleSandbox 的子进程：加载与父进程相同的规则，循环接收任务，把结果发回
+    任务为 ('text', (文本, 吧名), 跳过的规则序号) 或 ('file', (输入文件, 输出文件), 跳过的规则序号)
+    """
+    patterns = load_rules(rules_dir)
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        kind, args, skip = job
+        if kind == 'file':
+            conn.send(clean_file_stream(patterns, *args, skip=set(skip), progress=progress))
+        else:
+            conn.send(patterns.clean(*args, skip=set(skip), progress=progress))
+
+class RuleSandbox:
+    """
+    在子进程中清洗，个别规则在异常输入上回溯过久时不会卡住整批处理
+    
+    re 执行正则时无法从外部打断，只能结束整个进程：
+    单条规则超过 rule_timeout 秒时结束子进程，记录并跳过这条规则，重新清洗这个文件；
+    整个文件超过 file_timeout 秒（含重试）时放弃这个文件
+    """
+    
+    def __init__(self, patterns, rule_timeout=RULE_TIMEOUT, file_timeout=FILE_TIMEOUT, rules_dir=RULES_DIR):
+        """
+        参数:
+            patterns: 父进程中的规则（load_rules 的结果），用于显示超时的规则
+            rule_timeout: 单条规则的时间预算（秒），0 表示不限制
+            file_timeout: 单个文件的时间预算（秒），0 表示不限制
+            rules_dir: 子进程从这里加载规则
+        """
+        self.patterns = patterns
+        self.rule_timeout = rule_timeout
+        self.file_timeout = file_timeout
+        self.rules_dir = str(rules_dir)
+        self.process = None
+        self.conn = None
+        self.progress = None
+    
+    def start(self):
+        self.progress = multiprocessing.Value('q', -1, lock=False)
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=sandbox_worker,
+                                               args=(self.rules_dir, child_conn, self.progress), daemon=True)
+        self.process.start()
+        child_conn.close()
+    
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+            self.process = None
+    
+    def close(self):
+        """通知子进程退出"""
+        if self.process is not None:
+            try:
+                self.conn.send(None)
+                self.process.join(timeout=5)
+            except OSError:
+                pass
+            self.kill()
+    
+    def clean(self, text, bar=None):
+        """
+        返回:
+            (清洗结果, 被跳过的规则序号列表)；整个文件超时时清洗结果为 None
+        """
+        return self.run('text', (text, bar))
+    
+    def clean_file(self, input_file, output_file):
+        """
+        在子进程中分块清洗一个文件（见 clean_file_stream），文本不经过进程间管道
+        返回:
+            (是否完成, 被跳过的规则序号列表)；整个文件超时时不会留下输出文件
+        """
+        result, skipped = self.run('file', (str(input_file), str(output_file)))
+        if result is None:
+            Path(str(output_file) + '.tmp').unlink(missing_ok=True)
+        return result is not None, skipped
+    
+    def run(self, kind, args):
+        """把任务交给子进程，按时间预算跳过超时的规则或放弃整个文件"""
+        skipped = []
+        rule_count = len(self.patterns)
+        file_start = time.monotonic()
+        while True:
+            if self.process is None:
+                self.start()
+            self.progress.value = -1
+            self.conn.send((kind, args, skipped))
+            
+            current = -1
+            since = time.monotonic()
+            timed_out = False
+            while not self.conn.poll(SANDBOX_POLL_INTERVAL):
+                if not self.process.is_alive():
+                    self.kill()
+                    raise RuntimeError("清洗子进程意外退出")
+                now = time.monotonic()
+                if self.progress.value != current:
+                    current = self.progress.value
+                    since = now
+                if self.file_timeout and now - file_start > self.file_timeout:
+                    self.kill()
+                    # 子进程还没报告进度时 current 为 -1，取余会误报成最后一条规则
+                    running = f"当时在执行规则 #{current % rule_count + 1}" if current >= 0 else "尚未开始执行规则"
+                    print(f"    ⚠️  整个文件超过 {self.file_timeout} 秒，放弃（{running}）")
+                    return None, skipped
+                if self.rule_timeout and current >= 0 and now - since > self.rule_timeout:
+                    timed_out = True
+                    break
+            
+            if not timed_out:
+                return self.conn.recv(), skipped
+            
+            # 分块清洗时进度中还含有执行次数，余数才是规则序号
+            self.kill()
+            current %= rule_count
+            skipped.append(current)
+            pattern = self.patterns.rules[current].pattern
+            print(f"    ⚠️  规则 #{current + 1} 超过 {self.rule_timeout} 秒，已跳过: {pattern[:60]}")
+
+_engines = {}
+
+def compile_patterns(patterns):
+    """编译替换模式列表（相同的列表只编译一次）"""
+    key = tuple(patterns)
+    if key not in _engines:
+        _engines[key] = ReplacementEngine(key)
+    return _engines[key]
+
+def detect_bar(text):
+    """从帖子TXT的标题行中读取吧名（不带「吧」字），读不到时返回 None"""
+    match = BAR_PATTERN.match(text)
+    return match.group(1) if match else None
+
+def normalize_scope(scope):
+    """规则文件中的作用范围：吧名或吧名列表，「三体吧」和「三体」都可以"""
+    if scope is None:
+        return None
+    if isinstance(scope, str):
+        scope = [scope]
+    if not isinstance(scope, list) or not all(isinstance(bar, str) and bar.strip() for bar in scope):
+        raise ValueError("scope 应为吧名或吧名列表")
+    return [bar.strip()[:-1] if bar.strip().endswith('吧') else bar.strip() for bar in scope]
+
+def read_rule_file(path):
+    """
+    读取一个规则文件
+    
+    返回:
+        (规则列表 [(优先级, 正则表达式, 作用范围, 来源)], 来源说明)；文件无法使用时返回 None
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"❌ 规则文件无法读取，已忽略: {path.name} ({e})")
+        return None
+    if not isinstance(data, dict) or data.get('format') != RULE_FILE_FORMAT or not isinstance(data.get('rules'), list):
+        print(f"❌ 规则文件格式不对（需要 format: {RULE_FILE_FORMAT} 和 rules 列表），已忽略: {path.name}")
+        return None
+    
+    rules = []
+    for i, item in enumerate(data['rules'], 1):
+        # 只写一个字符串时视为关键词
+        if isinstance(item, str):
+            item = {'pattern': item}
+        try:
+            if not isinstance(item, dict) or not isinstance(item.get('pattern'), str) or not item['pattern']:
+                raise ValueError("缺少 pattern")
+            kind = item.get('type', 'exact')
+            if kind == 'exact':
+                pattern = re.escape(item['pattern'])
+            elif kind == 'regex':
+                pattern = item['pattern']
+                re.compile(pattern)
+                # 能匹配空串的规则会在每两个字之间插入竖线
+                if sre_parse.parse(pattern).getwidth()[0] == 0:
+                    raise ValueError("正则可能匹配空串（如 a*），会在每两个字之间插入竖线")
+            else:
+                raise ValueError(f"type 应为 exact 或 regex，而不是 {kind}")
+            priority = item.get('priority', 0)
+            if not isinstance(priority, (int, float)):
+                raise ValueError("priority 应为数字")
+            rules.append((priority, pattern, normalize_scope(item.get('scope')), path.name))
+        except (ValueError, re.error) as e:
+            print(f"  ✗ {path.name} 第{i}条规则无效，已跳过: {e}")
+    
+    source = f"{path.name} {data.get('version', '未标版本')} ({len(rules)} 条)"
+    return rules, source
+
+def rules_key(builtin, rule_files):
+    """内置规则和所有规则文件内容的哈希，作为缓存和增量清单中的规则版本"""
+    digest = hashlib.sha256()
+    digest.update(f"{RULE_CACHE_FORMAT}\0".encode('utf-8'))
+    digest.update(json.dumps(builtin, ensure_ascii=False).encode('utf-8'))
+    for path in rule_files:
+        digest.update(b'\0' + path.name.encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def load_rules(rules_dir=RULES_DIR):
+    """
+    加载内置规则和规则目录中的所有规则文件，编译成 ReplacementEngine
+    
+    规则按优先级从高到低执行，优先级相同时内置规则在前、规则文件按文件名和文件中的顺序；
+    内置规则的优先级为 0。
+    规则的分析结果缓存在规则目录中，规则没有变化时直接读取缓存，几千条规则也能立即开始
+    """
+    rules_dir = Path(rules_dir)
+    builtin = create_replacement_patterns()
+    # 以 . 开头的是缓存等文件，不是规则文件
+    rule_files = sorted(path for path in rules_dir.glob('*.json') if not path.name.startswith('.')) if rules_dir.is_dir() else []
+    key = rules_key(builtin, rule_files)
+    if not rule_files:
+        return ReplacementEngine(builtin, key[:16], [f"内置规则 ({len(builtin)} 条)"])
+    
+    cache_path = rules_dir / RULE_CACHE_NAME
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('key') == key:
+            rules = [ReplacementRule(item['pattern'], item['scope'], item['analysis'], item['source'])
+                     for item in cached['rules']]
+            return ReplacementEngine(rules, key[:16], cached['sources'])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    
+    entries = [(0, pattern, None, BUILTIN_SOURCE) for pattern in builtin]
+    sources = [f"内置规则 ({len(builtin)} 条)"]
+    for path in rule_files:
+        result = read_rule_file(path)
+        if result:
+            entries.extend(result[0])
+            sources.append(result[1])
+    # sorted 是稳定排序，优先级相同的保持原来的顺序
+    entries = sorted(entries, key=lambda entry: -entry[0])
+    engine = ReplacementEngine([ReplacementRule(pattern, scope, source=source)
+                                for _, pattern, scope, source in entries], key[:16], sources)
+    
+    data = {'key': key, 'sources': sources, 'rules': [rule.to_cache() for rule in engine.rules]}
+    temp_path = cache_path.with_name(cache_path.name + '.tmp')
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # 规则目录只读时不缓存，下次重新分析
+        pass
+    return engine
+
+def clean_text(text, patterns, bar=None):
     """
     清理文本中的格式内容
     
     参数:
         text: 原始文本
-        patterns: 替换模式列表
+        patterns: 替换模式列表，或 compile_patterns / load_rules 编译好的规则
+        bar: 帖子所在的吧，None 时从标题行读取（只影响带作用范围的规则）
     返回:
         清理后的文本
     """
-    cleaned_text = text
-    
-    # 逐个应用替换模式
-    for pattern in patterns:
-        cleaned_text = re.sub(pattern, '|', cleaned_text)
-    
-    # 清理连续的竖线（可选，保持整洁）
-    cleaned_text = re.sub(r'\|+', '|', cleaned_text)
+    if not isinstance(patterns, ReplacementEngine):
+        patterns = compile_patterns(patterns)
+    return patterns.clean(text, bar)
+
+def clean_file_stream(patterns, input_file, output_file, skip=(), progress=None):
+    """
+    分块读入、清洗、写出一个文件，内存占用不随文件大小增长，结果与整个读入后清洗完全相同
+    先写入临时文件，完成后再替换 output_file，中途中断时不会留下不完整的输出
     
-    return cleaned_text
+    参数:
+        patterns: load_rules 编译好的规则
+        skip, progress: 同 ReplacementEngine.clean_stream
+    返回:
+        True（供 RuleSandbox 区分完成和超时）
+    """
+    temp_path = Path(str(output_file) + '.tmp')
+    with open(input_file, 'r', encoding='utf-8', errors='ignore') as src, \
+            open(temp_path, 'w', encoding='utf-8') as dst:
+        chunks = iter(lambda: src.read(STREAM_CHUNK_SIZE), '')
+        for piece in patterns.clean_stream(chunks, skip=skip, progress=progress):
+            dst.write(piece)
+    os.replace(temp_path, output_file)
+    return True
 
-def process_files(input_dir, output_dir):
+def process_files(input_dir, output_dir, rule_timeout=RULE_TIMEOUT, file_timeout=FILE_TIMEOUT, stream=None):
     """
     批量处理文件
     
     参数:
         input_dir: 输入目录路径
         output_dir: 输出目录路径
+        rule_timeout: 单条规则在一个文件上的时间预算（秒），超时的规则被跳过
+        file_timeout: 单个文件的时间预算（秒），超时的文件不保存；两者都为 0 时不使用子进程
+        stream: True 时所有文件分块清洗，False 时都整个读入；None 时只分块清洗超过 STREAM_THRESHOLD 的文件
     """
     input_path = Path(input_dir)
     output_path = Path(output_dir)
@@ -267,9 +1164,14 @@ def process_files(input_dir, output_dir):
     # 创建输出目录
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # 获取替换模式
-    patterns = create_replacement_patterns()
-    print(f"✓ 已加载 {len(patterns)} 个替换规则")
+    # 获取并编译替换模式（内置规则 + rules 目录中的规则文件）
+    patterns = load_rules()
+    print(f"✓ 已加载 {len(patterns)} 个替换规则: {'，'.join(patterns.sources)}")
+    if stream is not False:
+        held = [i for i, rule in enumerate(patterns.rules, 1) if not rule.analysis.get('stop_class')]
+        if held:
+            print(f"⚠️  规则 {'、'.join(f'#{i}' for i in held[:10])} 含断言或可能匹配空串，"
+                  f"分块清洗时要读完整个文件才能执行，内存占用随文件大小增长")
     
     # 获取所有txt文件
     txt_files = list(input_path.glob("*.txt"))
@@ -281,44 +1183,197 @@ def process_files(input_dir, output_dir):
     print(f"✓ 找到 {len(txt_files)} 个txt文件")
     print("=" * 60)
     
+    # 上次已处理、之后没有变化的文件直接跳过
+    # 规则版本记录在清单中，规则文件修改后所有文件重新清洗
+    manifest = (stage_manifest.for_script(output_path, __file__, params={'rules': patterns.version})
+                if stage_manifest else None)
+    
+    # 在子进程中清洗，个别规则卡住时跳过它，不会卡住整批处理
+    sandbox = RuleSandbox(patterns, rule_timeout, file_timeout) if rule_timeout or file_timeout else None
+    timeout_files = []
+    
     # 处理每个文件
     success_count = 0
     error_count = 0
     
     for i, file_path in enumerate(txt_files, 1):
         try:
+            if manifest and manifest.is_current(file_path.name, [file_path]):
+                continue
             print(f"[{i}/{len(txt_files)}] 正在处理: {file_path.name}")
+            output_file = output_path / file_path.name
             
-            # 读取文件
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            # 清理文本
-            cleaned_content = clean_text(content, patterns)
+            skipped = []
+            if stream or (stream is None and file_path.stat().st_size > STREAM_THRESHOLD):
+                # 大文件分块读入、清洗、写出，不必整个放进内存
+                if sandbox:
+                    finished, skipped = sandbox.clean_file(file_path, output_file)
+                else:
+                    finished = clean_file_stream(patterns, file_path, output_file)
+            else:
+                # 读取文件
+                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    content = f.read()
+                
+                # 清理文本
+                if sandbox:
+                    cleaned_content, skipped = sandbox.clean(content)
+                else:
+                    cleaned_content = clean_text(content, patterns)
+                
+                # 保存到输出目录
+                finished = cleaned_content is not None
+                if finished:
+                    with open(output_file, 'w', encoding='utf-8') as f:
+                        f.write(cleaned_content)
             
-            # 保存到输出目录
-            output_file = output_path / file_path.name
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(cleaned_content)
+            if not finished:
+                print(f"    ❌ 处理超时，未保存")
+                timeout_files.append(file_path.name)
+                error_count += 1
+                continue
             
             print(f"    ✓ 已保存到: {output_file}")
             success_count += 1
+            # 跳过了超时规则的结果不完整，不记入清单，下次运行再试
+            if skipped:
+                timeout_files.append(file_path.name)
+            elif manifest:
+                manifest.record(file_path.name, output_file)
             
         except Exception as e:
             print(f"    ❌ 处理失败: {e}")
             error_count += 1
     
+    if sandbox:
+        sandbox.close()
+    if manifest:
+        manifest.save()
+    
     # 显示统计信息
     print("=" * 60)
     print(f"处理完成!")
     print(f"成功: {success_count} 个文件")
     print(f"失败: {error_count} 个文件")
+    if manifest and manifest.summary():
+        print(manifest.summary())
+    if timeout_files:
+        print(f"⚠️  {len(timeout_files)} 个文件有规则超时（已跳过该规则或放弃该文件）: {', '.join(timeout_files[:10])}")
+        if re2 is None:
+            print("   安装 google-re2（pip install google-re2）后，容易回溯的规则改用线性时间的RE2执行")
     print(f"输出目录: {output_dir}")
 
+def profile_rules(input_dir, report_path="rule_profile.json"):
+    """
+    统计每条规则在一批文件上的匹配次数、删除的字节数和累计耗时（不输出清洗结果）
+    打印按耗时排序的表格和从未匹配过的规则，完整结果保存为JSON
+    
+    参数:
+        input_dir: TXT文件所在目录（一般为 01_original_txt）
+        report_path: JSON报告的保存位置
+    """
+    input_path = Path(input_dir)
+    if not input_path.exists():
+        print(f"❌ 错误: 输入目录不存在: {input_dir}")
+        return None
+    txt_files = sorted(input_path.glob("*.txt"))
+    if not txt_files:
+        print(f"❌ 在目录 {input_dir} 中未找到任何txt文件")
+        return None
+    
+    patterns = load_rules()
+    print(f"✓ 已加载 {len(patterns)} 个替换规则: {'，'.join(patterns.sources)}")
+    print(f"✓ 统计 {len(txt_files)} 个txt文件...")
+    
+    # 规则平时在第一次使用时才编译；先全部编译好，一次性的编译开销（如 RE2 的字符范围表）不算进某条规则的耗时
+    for rule in patterns.rules:
+        rule.compile()
+    
+    stats = patterns.new_stats()
+    total_chars = 0
+    start = time.perf_counter()
+    for file_path in txt_files:
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            content = f.read()
+        total_chars += len(content)
+        patterns.clean(content, stats=stats)
+    elapsed = time.perf_counter() - start
+    
+    rules = []
+    for i, (rule, stat) in enumerate(zip(patterns.rules, stats), 1):
+        rules.append({
+            'index': i,
+            'pattern': rule.pattern,
+            'source': rule.source,
+            'scope': sorted(rule.scope) if rule.scope else None,
+            'matches': stat['matches'],
+            'bytes_removed': stat['bytes_removed'],
+            'time': round(stat['time'], 6),
+            'files': stat['files'],
+            'never_matched': stat['matches'] == 0,
+        })
+    rule_time = sum(stat['time'] for stat in stats)
+    never_matched = [rule for rule in rules if rule['never_matched']]
+    report = {
+        'input': str(input_path.absolute()),
+        'files': len(txt_files),
+        'chars': total_chars,
+        'rules_version': patterns.version,
+        'sources': patterns.sources,
+        'total_time': round(elapsed, 6),
+        'rule_time': round(rule_time, 6),
+        'rules': rules,
+        'never_matched': [rule['index'] for rule in never_matched],
+    }
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    print("=" * 60)
+    print(f"{'序号':>4}{'耗时':>11}{'占比':>8}{'匹配次数':>10}{'删除字节':>12}  规则")
+    for rule in sorted(rules, key=lambda rule: -rule['time']):
+        share = rule['time'] / rule_time if rule_time else 0
+        pattern = rule['pattern'] if len(rule['pattern']) <= 40 else rule['pattern'][:40] + '…'
+        source = '' if rule['source'] == BUILTIN_SOURCE else f"  [{rule['source']}]"
+        mark = '  ✗ 未匹配' if rule['never_matched'] else ''
+        print(f"{rule['index']:>4}{rule['time'] * 1000:>9.1f}ms{share:>8.1%}{rule['matches']:>10}"
+              f"{rule['bytes_removed']:>12}  {pattern}{source}{mark}")
+    print("=" * 60)
+    print(f"文件: {len(txt_files)} 个，{total_chars:,} 字符，总耗时 {elapsed:.2f}s（规则本身 {rule_time:.2f}s）")
+    print(f"从未匹配的规则: {len(never_matched)} / {len(rules)} 条")
+    for rule in never_matched:
+        print(f"  #{rule['index']} {rule['pattern']}  ({rule['source']})")
+    print(f"完整结果已保存到: {Path(report_path).absolute()}")
+    return report
+
 def main():
     """
     主函数
     """
+    # 带命令行参数时不再逐项询问
+    if len(sys.argv) > 1:
+        parser = argparse.ArgumentParser(description='贴吧文本批量清理工具')
+        parser.add_argument('-i', '--input', required=True, help='TXT文件所在目录')
+        parser.add_argument('-o', '--output', help='清理后文件的输出目录')
+        parser.add_argument('--profile-rules', action='store_true',
+                            help='统计每条规则的匹配次数、删除字节数和耗时，不输出清理结果')
+        parser.add_argument('--report', default='rule_profile.json',
+                            help='--profile-rules 的JSON报告保存位置 (默认: rule_profile.json)')
+        parser.add_argument('--rule-timeout', type=float, default=RULE_TIMEOUT,
+                            help=f'单条规则在一个文件上的时间预算，超时跳过该规则 (默认: {RULE_TIMEOUT}秒，0 为不限)')
+        parser.add_argument('--file-timeout', type=float, default=FILE_TIMEOUT,
+                            help=f'单个文件的时间预算，超时不保存该文件 (默认: {FILE_TIMEOUT}秒，0 为不限)')
+        parser.add_argument('--stream', action='store_true',
+                            help=f'所有文件都分块清洗 (默认只分块清洗超过 {STREAM_THRESHOLD // 1024 // 1024}MB 的文件)')
+        args = parser.parse_args()
+        if args.profile_rules:
+            profile_rules(args.input, args.report)
+        elif args.output:
+            process_files(args.input, args.output, args.rule_timeout, args.file_timeout,
+                          stream=True if args.stream else None)
+        else:
+            parser.error('需要 -o 输出目录，或使用 --profile-rules')
+        return
+    
     print("=" * 60)
     print("贴吧文本批量清理工具")
     print("=" * 60)
@@ -366,4 +1421,6 @@ def main():
     input("按回车键退出...")
 
 if __name__ == "__main__":
+    # 打包成exe后，时间预算用的子进程需要它
+    multiprocessing.freeze_support()
     main()
@@ -10,8 +10,16 @@ TXT文件批量处理脚本
 
 import os
 import re
+import sys
 from pathlib import Path
 
+# 各步骤共用的增量清单 scripts/stage_manifest.py；单独复制本脚本时没有它，每次全部处理
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+try:
+    import stage_manifest
+except ImportError:
+    stage_manifest = None
+
 
 def is_pipe_only_line(line):
     """检查一行是否仅包含竖线字符"""
@@ -193,11 +201,18 @@ def main():
     success_count = 0
     fail_count = 0
     
+    # 上次已处理、之后没有变化的文件直接跳过
+    manifest = stage_manifest.for_script(output_dir, __file__) if stage_manifest else None
+    
     for i, input_file in enumerate(txt_files, 1):
         # 构建输出文件路径，保持相对路径结构
         relative_path = input_file.relative_to(input_dir)
         output_file = Path(output_dir) / relative_path
         
+        key = relative_path.as_posix()
+        if manifest and manifest.is_current(key, [input_file]):
+            continue
+        
         # 创建输出文件的父目录
         output_file.parent.mkdir(parents=True, exist_ok=True)
         
@@ -208,15 +223,22 @@ def main():
         if success:
             print(f"    ✓ 成功")
             success_count += 1
+            if manifest:
+                manifest.record(key, output_file)
         else:
             print(f"    ✗ 失败: {error}")
             fail_count += 1
     
+    if manifest:
+        manifest.save()
+    
     # 显示统计结果
     print("-" * 60)
     print(f"\n处理完成!")
     print(f"成功: {success_count} 个文件")
     print(f"失败: {fail_count} 个文件")
+    if manifest and manifest.summary():
+        print(manifest.summary())
     print(f"总计: {len(txt_files)} 个文件")
     print()
 
@@ -10,9 +10,17 @@
 """
 
 import os
+import sys
 import glob
 from pathlib import Path
 
+# 各步骤共用的增量清单 scripts/stage_manifest.py；单独复制本脚本时没有它，每次全部处理
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+try:
+    import stage_manifest
+except ImportError:
+    stage_manifest = None
+
 
 def clean_line(line):
     """
@@ -203,8 +211,13 @@ def main():
         fail_count = 0
         total_duplicates = 0
         
+        # 上次已处理、之后没有变化的文件直接跳过
+        manifest = stage_manifest.for_script(output_path, __file__) if stage_manifest else None
+        
         for i, input_file in enumerate(txt_files, 1):
             filename = os.path.basename(input_file)
+            if manifest and manifest.is_current(filename, [input_file]):
+                continue
             print(f"\n[{i}/{len(txt_files)}] 处理: {filename}")
             
             # 生成输出文件路径
@@ -220,10 +233,15 @@ def main():
                 print(f"    输出位置: {output_file}")
                 success_count += 1
                 total_duplicates += result['duplicates_removed']
+                if manifest:
+                    manifest.record(filename, output_file)
             else:
                 print(f"  ❌ 失败: {result['error']}")
                 fail_count += 1
         
+        if manifest:
+            manifest.save()
+        
         # 显示总结
         print("\n" + "=" * 60)
         print("处理完成!")
@@ -231,6 +249,8 @@ def main():
         print(f"成功: {success_count} 个文件")
         print(f"失败: {fail_count} 个文件")
         print(f"共处理重复行: {total_duplicates} 行")
+        if manifest and manifest.summary():
+            print(manifest.summary())
         print("=" * 60)
         
         # 询问是否继续
@@ -14,6 +14,13 @@ import os
 import sys
 from pathlib import Path
 
+# 各步骤共用的增量清单 scripts/stage_manifest.py；单独复制本脚本时没有它，每次全部处理
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+try:
+    import stage_manifest
+except ImportError:
+    stage_manifest = None
+
 
 def clean_line(line):
     """
@@ -304,10 +311,16 @@ def main():
     total_deleted = 0
     failed_files = []
     
+    # 上次已处理、之后没有变化的文件直接跳过
+    manifest = stage_manifest.for_script(output_path, __file__) if stage_manifest else None
+    
     for i, file_path in enumerate(files_to_process, 1):
         # 构建输出文件路径
         output_file = Path(output_path) / f"dedup_{file_path.name}"
         
+        if manifest and manifest.is_current(file_path.name, [file_path]):
+            continue
+        
         print(f"\n[{i}/{len(files_to_process)}] {file_path.name}")
         
         # 决定是否显示详细信息
@@ -322,12 +335,17 @@ def main():
             print(f"    保留: {result['kept']:,} 行")
             success_count += 1
             total_deleted += result['deleted']
+            if manifest:
+                manifest.record(file_path.name, output_file)
         else:
             print(f"  ✗ 处理失败")
             print(f"    原因: {result['error']}")
             fail_count += 1
             failed_files.append((file_path.name, result['error']))
     
+    if manifest:
+        manifest.save()
+    
     # 打印总结
     print()
     print("=" * 60)
@@ -335,6 +353,8 @@ def main():
     print(f"成功: {success_count} 个文件")
     print(f"失败: {fail_count} 个文件")
     print(f"总共删除: {total_deleted:,} 行重复内容")
+    if manifest and manifest.summary():
+        print(manifest.summary())
     
     if failed_files:
         print()
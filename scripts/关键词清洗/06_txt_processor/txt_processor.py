@@ -7,8 +7,16 @@ TXT文本批量处理脚本
 
 import os
 import re
+import sys
 from pathlib import Path
 
+# 各步骤共用的增量清单 scripts/stage_manifest.py；单独复制本脚本时没有它，每次全部处理
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+try:
+    import stage_manifest
+except ImportError:
+    stage_manifest = None
+
 
 def count_pipe_space(text):
     """统计文本中"| "(竖线+空格)的总数"""
@@ -116,11 +124,17 @@ def main():
     success_count = 0
     failed_count = 0
     
+    # 上次已处理、之后没有变化的文件直接跳过
+    manifest = stage_manifest.for_script(output_path, __file__) if stage_manifest else None
+    
     # 处理每个文件
     for txt_file in txt_files:
         filename = txt_file.name
         output_file = os.path.join(output_path, filename)
         
+        if manifest and manifest.is_current(filename, [txt_file]):
+            continue
+        
         result = process_file(txt_file, output_file)
         
         if result[0]:
@@ -131,11 +145,16 @@ def main():
             total_newlines += newline_count
             print(f"✓ {filename}")
             print(f"  检测到 {pipe_space_count} 个'| '组合 -> 输出 {newline_count} 个换行符")
+            if manifest:
+                manifest.record(filename, output_file)
         else:
             failed_count += 1
             error_msg = result[3]
             print(f"✗ {filename} - 处理失败: {error_msg}")
     
+    if manifest:
+        manifest.save()
+    
     # 输出总结
     print()
     print("=" * 60)
@@ -143,6 +162,8 @@ def main():
     print("-" * 60)
     print(f"成功处理: {success_count} 个文件")
     print(f"处理失败: {failed_count} 个文件")
+    if manifest and manifest.summary():
+        print(manifest.summary())
     print(f"总共检测到: {total_pipe_space} 个'| '组合")
     print(f"总共输出: {total_newlines} 个换行符")
     print(f"结果已保存到: {output_path}")
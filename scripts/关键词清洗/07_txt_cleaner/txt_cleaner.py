@@ -10,7 +10,16 @@ TXT文件批量清理工具
 """
 
 import os
+import sys
 import glob
+from pathlib import Path
+
+# 各步骤共用的增量清单 scripts/stage_manifest.py；单独复制本脚本时没有它，每次全部处理
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+try:
+    import stage_manifest
+except ImportError:
+    stage_manifest = None
 
 
 def clean_txt_file(content):
@@ -91,11 +100,16 @@ def process_txt_files(input_dir, output_dir):
     print(f"\n找到 {len(txt_files)} 个TXT文件")
     print("=" * 60)
     
+    # 上次已处理、之后没有变化的文件直接跳过
+    manifest = stage_manifest.for_script(output_dir, __file__) if stage_manifest else None
+    
     # 处理每个文件
     success_count = 0
     for txt_file in txt_files:
         try:
             filename = os.path.basename(txt_file)
+            if manifest and manifest.is_current(filename, [txt_file]):
+                continue
             print(f"\n正在处理：{filename}")
             
             # 读取文件
@@ -118,12 +132,21 @@ def process_txt_files(input_dir, output_dir):
             
             print(f"  ✓ 已保存到：{output_file}")
             success_count += 1
+            if manifest:
+                manifest.record(filename, output_file)
             
         except Exception as e:
             print(f"  ✗ 处理失败：{str(e)}")
     
+    if manifest:
+        manifest.save()
+    
     print("\n" + "=" * 60)
-    print(f"处理完成！成功处理 {success_count}/{len(txt_files)} 个文件")
+    # 跳过的文件单独统计（与 03~06 相同），不算作成功处理
+    skipped = manifest.skipped if manifest else 0
+    print(f"处理完成！成功处理 {success_count}/{len(txt_files) - skipped} 个文件")
+    if manifest and manifest.summary():
+        print(manifest.summary())
 
 
 def main():
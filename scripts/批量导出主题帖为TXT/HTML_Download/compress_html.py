@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTML存档压缩工具
+1. 把已下载的 .html 文件压缩为 .html.gz 或 .html.zst（html_to_txt_v2.py 可直接读取）
+2. 测试各格式在冷缓存下「读盘 + 解压」的耗时，判断压缩后是否反而更快
+"""
+
+import gzip
+import importlib.util
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CONVERTER_PATH = Path(__file__).resolve().parent.parent / "HTML_to_TXT" / "html_to_txt_v2.py"
+
+# 与 download_html_simple.py 保持一致
+ZSTD_DICT_NAME = "html.zdict"
+ZSTD_LEVEL = 19
+
+
+def load_converter():
+    """加载 html_to_txt_v2.py，使用它的读取函数校验压缩结果"""
+    spec = importlib.util.spec_from_file_location("html_to_txt_v2", CONVERTER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def zstd_compressor(directory, sample):
+    """
+    目录对应的zst压缩器
+    目录中还没有压缩字典时，用 sample（第一个文件的内容）作为字典
+    """
+    dict_file = directory / ZSTD_DICT_NAME
+    if not dict_file.exists():
+        with open(dict_file, 'wb') as f:
+            f.write(sample)
+    with open(dict_file, 'rb') as f:
+        dict_data = zstandard.ZstdCompressionDict(f.read(), dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+
+
+def compress_archive(directory, fmt, keep=False):
+    """
+    压缩目录中所有未压缩的 .html 文件
+    
+    参数:
+        directory: 下载目录
+        fmt: 'gz' 或 'zst'
+        keep: 是否保留原文件
+    返回:
+        (压缩前总字节数, 压缩后总字节数)
+    """
+    directory = Path(directory)
+    converter = load_converter()
+    html_files = sorted(directory.glob('*.html'))
+    compressor = None
+    before = after = 0
+    
+    for i, html_file in enumerate(html_files, 1):
+        with open(html_file, 'rb') as f:
+            data = f.read()
+        
+        if fmt == 'zst':
+            if compressor is None:
+                compressor = zstd_compressor(directory, data)
+            packed = compressor.compress(data)
+        else:
+            packed = gzip.compress(data)
+        
+        target = directory / (html_file.name + '.' + fmt)
+        with open(target, 'wb') as f:
+            f.write(packed)
+        
+        # 确认能原样读回后才删除原文件
+        if converter.read_html_bytes(target) != data:
+            print(f"✗ 校验失败，保留原文件: {html_file.name}")
+            target.unlink()
+            continue
+        if not keep:
+            html_file.unlink()
+        
+        before += len(data)
+        after += len(packed)
+        if i % 100 == 0 or i == len(html_files):
+            print(f"  [{i}/{len(html_files)}] {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB")
+    
+    return before, after
+
+
+def drop_cache(path):
+    """把文件移出系统缓存，模拟冷缓存读取（仅 Linux/macOS 支持）"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def benchmark(directory, sample_size=200):
+    """
+    取目录中最多 sample_size 个 .html 文件，分别保存为 html/gz/zst，
+    比较冷缓存下读盘和解压的耗时
+    """
+    directory = Path(directory)
+    converter = load_converter()
+    html_files = sorted(directory.glob('*.html'))[:sample_size]
+    if not html_files:
+        print(f"❌ {directory} 中没有 .html 文件")
+        return
+    
+    cold = hasattr(os, 'posix_fadvise')
+    if not cold:
+        print("⚠️  当前系统不支持清除文件缓存，以下为热缓存结果，仅供参考")
+    
+    formats = ['html', 'gz'] + (['zst'] if zstandard else [])
+    # 测试文件放在同一磁盘上
+    work_dir = Path(tempfile.mkdtemp(prefix='compress_bench_', dir=directory))
+    try:
+        files = {fmt: [] for fmt in formats}
+        compressor = None
+        for html_file in html_files:
+            with open(html_file, 'rb') as f:
+                data = f.read()
+            for fmt in formats:
+                if fmt == 'html':
+                    packed = data
+                elif fmt == 'gz':
+                    packed = gzip.compress(data)
+                else:
+                    if compressor is None:
+                        compressor = zstd_compressor(work_dir, data)
+                    packed = compressor.compress(data)
+                target = work_dir / (html_file.name + ('' if fmt == 'html' else '.' + fmt))
+                with open(target, 'wb') as f:
+                    f.write(packed)
+                files[fmt].append(target)
+        
+        print()
+        print(f"样本: {len(html_files)} 个文件")
+        print(f"{'格式':<6}{'总大小':>12}{'读盘':>12}{'解压':>12}{'合计':>12}")
+        for fmt in formats:
+            if cold:
+                for path in files[fmt]:
+                    drop_cache(path)
+                if fmt == 'zst':
+                    drop_cache(work_dir / ZSTD_DICT_NAME)
+            
+            size = sum(path.stat().st_size for path in files[fmt])
+            read_time = 0.0
+            decode_time = 0.0
+            for path in files[fmt]:
+                start = time.perf_counter()
+                with open(path, 'rb') as f:
+                    f.read()
+                read_time += time.perf_counter() - start
+                
+                # 第二次读取已在缓存中，多出来的时间就是解压耗时
+                start = time.perf_counter()
+                converter.read_html_bytes(path)
+                decode_time += time.perf_counter() - start
+            
+            print(f"{fmt:<6}{size / 1024 / 1024:>10.1f}MB{read_time * 1000:>10.0f}ms"
+                  f"{decode_time * 1000:>10.0f}ms{(read_time + decode_time) * 1000:>10.0f}ms")
+        print()
+        print("「合计」越小越好；压缩格式的合计小于 html 时，说明解压比多读的磁盘数据更快")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def main():
+    print("="*60)
+    print("HTML存档压缩工具")
+    print("="*60)
+    print()
+    
+    directory = input("HTML所在目录（直接回车: downloaded_html）: ").strip() or "downloaded_html"
+    if not Path(directory).exists():
+        print(f"❌ 找不到目录 {directory}")
+        input("按回车退出...")
+        return
+    
+    print("操作：")
+    print("  1 = 压缩为 .html.gz")
+    print("  2 = 压缩为 .html.zst（压缩率更高，需要 pip install zstandard）")
+    print("  3 = 测试读取速度（不修改原文件）")
+    choice = input("请选择: ").strip()
+    
+    print()
+    if choice in ('1', '2'):
+        fmt = 'gz' if choice == '1' else 'zst'
+        if fmt == 'zst' and zstandard is None:
+            print("❌ 未安装 zstandard，请先运行: pip install zstandard")
+            input("按回车退出...")
+            return
+        keep = input("保留原 .html 文件？(y/n，直接回车: n): ").strip().lower() == 'y'
+        before, after = compress_archive(directory, fmt, keep=keep)
+        print()
+        if before:
+            print(f"✓ 压缩完成: {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB"
+                  f"（{before / after:.1f} 倍）")
+            if fmt == 'zst':
+                print(f"  ⚠️  {ZSTD_DICT_NAME} 是所有 .html.zst 的压缩字典，请勿删除或修改")
+        else:
+            print("没有需要压缩的 .html 文件")
+    elif choice == '3':
+        benchmark(directory)
+    else:
+        print("已取消")
+    
+    print()
+    input("按回车退出...")
+
+
+if __name__ == "__main__":
+    main()
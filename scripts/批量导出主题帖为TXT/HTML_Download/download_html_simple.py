@@ -13,33 +13,417 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import time
 import os
+import sys
 from pathlib import Path
 import json
+import queue
+import threading
+import gzip
+import zlib
+import http.client
+import html as html_lib
+import re
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 与转换器共用的404/已删除页面判断 ../dead_page.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dead_page import DELETED_MARKERS, is_dead_page
+
+
+class RateLimiter:
+    """
+    全局速率限制器
+    所有工作线程共享同一个实例，保证总请求频率不超过设定上限
+    """
+    
+    def __init__(self, max_per_minute=None):
+        # 两次请求之间的最小间隔（秒），0 表示不限速
+        self.interval = 60.0 / max_per_minute if max_per_minute else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        """阻塞直到允许发出下一个请求"""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    自适应速率控制（AIMD：加性增、乘性减）
+    
+    - 页面加载快且正常：逐步缩短请求间隔（每次提高一点速率）
+    - 加载缓慢、遇到登录墙或出错：速率减半，并按连续失败次数指数退避暂停
+    - 速率始终不超过全局上限 max_per_minute
+    """
+    
+    # 未设置上限时，两次请求之间最短间隔（秒）
+    MIN_INTERVAL = 0.5
+    # 最长间隔（秒）
+    MAX_INTERVAL = 60.0
+    # 每个正常页面增加的速率（次/秒）
+    RATE_STEP = 0.02
+    # 加载时间超过该值视为缓慢（秒）
+    SLOW_SECONDS = 8.0
+    # 退避暂停的基数和上限（秒）
+    BACKOFF_BASE = 5.0
+    BACKOFF_MAX = 300.0
+    
+    def __init__(self, initial_interval=3.0, max_per_minute=None):
+        super().__init__(max_per_minute)
+        self.min_interval = self.interval or self.MIN_INTERVAL
+        self.interval = min(max(initial_interval, self.min_interval), self.MAX_INTERVAL)
+        self.failures = 0
+        self.requests = 0
+        self.started = None
+    
+    def wait(self):
+        """阻塞直到允许发出下一个请求"""
+        with self.lock:
+            now = time.monotonic()
+            if self.started is None:
+                self.started = now
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+            self.requests += 1
+        if start > now:
+            time.sleep(start - now)
+    
+    def report(self, status, load_time):
+        """
+        反馈一次请求的结果，调整速率
+        
+        参数:
+            status: 'ok' / 'dead' / 'login' / 'failed'
+            load_time: 页面加载耗时（秒）
+        返回:
+            本次触发的退避暂停秒数（0 表示没有退避）
+        """
+        with self.lock:
+            if status in ('ok', 'dead') and load_time < self.SLOW_SECONDS:
+                self.failures = 0
+                if status == 'ok':
+                    rate = 1.0 / self.interval + self.RATE_STEP
+                    self.interval = max(1.0 / rate, self.min_interval)
+                return 0.0
+            
+            # 变慢、登录墙或出错：速率减半 + 指数退避
+            self.failures += 1
+            self.interval = min(self.interval * 2, self.MAX_INTERVAL)
+            backoff = min(self.BACKOFF_BASE * 2 ** (self.failures - 1), self.BACKOFF_MAX)
+            self.next_time = max(self.next_time, time.monotonic() + backoff)
+            return backoff
+    
+    def current_rate(self):
+        """当前设定速率（次/分钟）"""
+        return 60.0 / self.interval
+    
+    def effective_rate(self):
+        """从开始到现在的实际平均速率（次/分钟）"""
+        if not self.started or not self.requests:
+            return 0.0
+        elapsed = time.monotonic() - self.started
+        return self.requests * 60.0 / elapsed if elapsed > 0 else 0.0
+
+
+class ProgressJournal:
+    """
+    追加式进度日志（JSONL，每行一条记录）
+    
+    每完成或失败一个URL只追加一行，不再整份重写；
+    启动时顺序读取一遍即可恢复每个URL的最新状态；
+    追加的记录累计较多时压缩为每个URL一行（先写临时文件再替换，中途崩溃不会损坏）。
+    
+    记录字段: url, status, bytes, error, attempts, time, pages（帖子首页记录总页数）
+    status 取值:
+        ok     - 下载成功
+        failed - 下载出错（下次运行会重试）
+        login  - 遇到登录墙（下次运行会重试）
+        dead   - 帖子已删除/404（下次运行跳过）
+    """
+    
+    def __init__(self, journal_file, legacy_file=None, compact_every=500):
+        self.journal_file = Path(journal_file)
+        self.compact_every = compact_every
+        self.records = {}
+        self.appended = 0
+        self.lock = threading.Lock()
+        self.load(legacy_file)
+        self.fh = open(self.journal_file, 'a', encoding='utf-8')
+    
+    def load(self, legacy_file=None):
+        """读取日志，恢复每个URL的最新记录"""
+        # 兼容旧版 progress.json（已下载URL的完整列表）
+        if legacy_file and Path(legacy_file).exists() and not self.journal_file.exists():
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                for url in json.load(f):
+                    self.records[url] = {'url': url, 'status': 'ok'}
+            self.rewrite()
+            print(f"✓ 已从 {Path(legacy_file).name} 迁移 {len(self.records)} 条进度")
+        
+        if not self.journal_file.exists():
+            return
+        
+        lines = 0
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时最后一行可能只写了一半，忽略即可
+                    continue
+                self.records[record['url']] = record
+                lines += 1
+        
+        # 重复记录过多时启动即压缩
+        if lines > 2 * len(self.records) + self.compact_every:
+            self.rewrite()
+    
+    def rewrite(self):
+        """压缩日志：每个URL只保留最新一条记录"""
+        tmp_file = self.journal_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for record in self.records.values():
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.journal_file)
+    
+    def record(self, url, status, size=None, error=None, pages=None):
+        """追加一条记录"""
+        with self.lock:
+            previous = self.records.get(url, {})
+            record = {
+                'url': url,
+                'status': status,
+                'attempts': previous.get('attempts', 0) + 1,
+                'time': int(time.time()),
+            }
+            if size is not None:
+                record['bytes'] = size
+            if error:
+                record['error'] = str(error)[:200]
+            if pages is not None:
+                record['pages'] = pages
+            
+            self.records[url] = record
+            self.fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.fh.flush()
+            
+            self.appended += 1
+            if self.appended >= self.compact_every:
+                self.fh.close()
+                self.rewrite()
+                self.fh = open(self.journal_file, 'a', encoding='utf-8')
+                self.appended = 0
+    
+    def status(self, url):
+        """返回URL的最新状态，没有记录时返回 None"""
+        record = self.records.get(url)
+        return record['status'] if record else None
+    
+    def pages(self, url):
+        """返回帖子首页记录的总页数，没有记录时返回 1"""
+        record = self.records.get(url)
+        return record.get('pages', 1) if record else 1
+    
+    def urls_with_status(self, status):
+        """返回指定状态的URL集合"""
+        return {url for url, record in self.records.items() if record['status'] == status}
+    
+    def close(self):
+        with self.lock:
+            if not self.fh.closed:
+                self.fh.close()
+
+
+class HttpFetcher:
+    """
+    纯HTTP下载器（不启动浏览器渲染页面）
+    
+    使用浏览器登录后导出的cookies直接请求 /p/<id> 页面；
+    每个线程持有一个 keep-alive 连接并反复复用，避免每页重新握手。
+    """
+    
+    def __init__(self, cookies, base_url="https://tieba.baidu.com", user_agent=None, timeout=30):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self.headers = {
+            'User-Agent': user_agent or (
+                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                '(KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+            ),
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Encoding': 'gzip, deflate',
+            'Accept-Language': 'zh-CN,zh;q=0.9',
+            'Connection': 'keep-alive',
+        }
+        cookie_header = '; '.join(f"{c['name']}={c['value']}" for c in cookies)
+        if cookie_header:
+            self.headers['Cookie'] = cookie_header
+        
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+    
+    def connection(self):
+        """返回当前线程的连接，没有则新建"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            if self.scheme == 'https':
+                conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+    
+    def reset_connection(self):
+        """丢弃当前线程的连接（服务器断开keep-alive时使用）"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+    
+    def get(self, url, max_redirects=3):
+        """
+        GET 请求
+        
+        返回: (HTTP状态码, 页面文本)
+        """
+        parts = urlsplit(url)
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        
+        for _ in range(max_redirects + 1):
+            # 服务器可能已关闭空闲连接，断开时重连一次
+            for retry in range(2):
+                conn = self.connection()
+                try:
+                    conn.request('GET', path, headers=self.headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                    break
+                except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                        ConnectionResetError, BrokenPipeError):
+                    self.reset_connection()
+                    if retry:
+                        raise
+                except BaseException:
+                    # 超时等其它错误时连接可能停在读了一半的响应中，不能再复用
+                    self.reset_connection()
+                    raise
+            
+            if response.getheader('Connection', '').lower() == 'close':
+                self.reset_connection()
+            
+            # 只跟随同一站点内的跳转
+            location = response.getheader('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                target = urlsplit(location)
+                if target.hostname and target.hostname != self.host:
+                    return response.status, ''
+                path = (target.path or '/') + (f'?{target.query}' if target.query else '')
+                continue
+            
+            return response.status, self.decode(response, body)
+        
+        return response.status, ''
+    
+    @staticmethod
+    def decode(response, body):
+        """按响应头解压并解码页面"""
+        encoding = (response.getheader('Content-Encoding') or '').lower()
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        elif encoding == 'deflate':
+            body = zlib.decompress(body)
+        
+        charset = response.headers.get_content_charset() or 'utf-8'
+        try:
+            return body.decode(charset, errors='replace')
+        except LookupError:
+            return body.decode('utf-8', errors='replace')
+    
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+
 
 class SimpleTiebaDownloader:
-    def __init__(self, output_dir="downloaded_html"):
+    # 轻量模式下拦截的资源：图片、字体、音视频，以及常见广告/统计域名
+    BLOCKED_URL_PATTERNS = [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.bmp", "*.ico", "*.svg",
+        "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+        "*.mp4", "*.m3u8", "*.flv", "*.ts", "*.mp3", "*.webm",
+        "*hm.baidu.com*", "*pos.baidu.com*", "*cpro.baidu.com*", "*cbjs.baidu.com*",
+        "*eclick.baidu.com*", "*mobads.baidu.com*", "*als.baidu.com*", "*afd.baidu.com*",
+        "*feed.baidu.com*", "*sp0.baidu.com*", "*gss0.bdstatic.com/sys/portrait*",
+        "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*",
+    ]
+    
+    # 压缩保存时的扩展名
+    HTML_SUFFIXES = {None: '.html', 'gz': '.html.gz', 'zst': '.html.zst'}
+    # zst 格式的压缩字典（第一个保存的页面），同目录所有 .html.zst 都需要它才能解压
+    ZSTD_DICT_NAME = "html.zdict"
+    ZSTD_LEVEL = 19
+    
+    def __init__(self, output_dir="downloaded_html", headless=False, block_resources=False, compact=False,
+                 compress=None):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
-        self.progress_file = self.output_dir / "progress.json"
-        self.downloaded = self.load_progress()
+        self.progress = ProgressJournal(
+            self.output_dir / "progress.jsonl",
+            legacy_file=self.output_dir / "progress.json",
+        )
+        # 登录成功后保存的会话（cookies），下次运行直接复用
+        self.session_file = self.output_dir / "session_cookies.json"
         self.driver = None
+        self.driver_path = None
+        # 无窗口模式（手动登录时仍会打开窗口）
+        self.headless = headless
+        # 不加载图片、字体、音视频和广告脚本
+        self.block_resources = block_resources
+        # 只保存标题、描述和楼层内容，不保存整个页面
+        self.compact = compact
+        # None 不压缩；'gz' 保存为 .html.gz；'zst' 保存为 .html.zst
+        if compress == 'zst' and zstandard is None:
+            print("⚠️  未安装 zstandard（pip install zstandard），改用 gz 压缩")
+            compress = 'gz'
+        self.compress = compress
+        self.zstd_dict = None
+        self.zstd_local = threading.local()
+        self.zstd_lock = threading.Lock()
+        # 从帖子首页发现的后续分页URL，由下载循环取走
+        self.discovered = queue.Queue()
+        # 统计实际传输的字节数
+        self.transferred = 0
+        # 多线程模式下保护控制台输出
+        self.print_lock = threading.Lock()
+        # 每保存一个页面调用一次 on_page_saved(url, html)，流水线模式用它把页面交给后续处理
+        self.on_page_saved = None
     
-    def load_progress(self):
-        """加载进度"""
-        if self.progress_file.exists():
-            with open(self.progress_file, 'r', encoding='utf-8') as f:
-                return set(json.load(f))
-        return set()
-    
-    def save_progress(self):
-        """保存进度"""
-        with open(self.progress_file, 'w', encoding='utf-8') as f:
-            json.dump(list(self.downloaded), f)
-    
-    def setup_driver(self):
-        """设置浏览器 - 使用独立的新实例"""
-        print("正在启动浏览器...")
-        
+    def create_chrome_options(self, headless=False, block_resources=False):
+        """创建浏览器配置"""
         chrome_options = Options()
         
         # 关键设置：避免与现有Chrome冲突
@@ -55,24 +439,68 @@ class SimpleTiebaDownloader:
         # 不使用现有配置，避免冲突
         chrome_options.add_argument("--disable-extensions")
         
-        try:
-            # 优先使用 webdriver-manager
+        if headless:
+            chrome_options.add_argument("--headless=new")
+        
+        if block_resources:
+            # 通过浏览器设置禁止图片和插件；字体、视频、广告在 create_driver 中按URL拦截
+            chrome_options.add_experimental_option("prefs", {
+                "profile.managed_default_content_settings.images": 2,
+                "profile.managed_default_content_settings.plugins": 2,
+                "profile.managed_default_content_settings.notifications": 2,
+            })
+            chrome_options.add_argument("--autoplay-policy=user-gesture-required")
+            chrome_options.add_argument("--mute-audio")
+        
+        # 打开性能日志，用于统计每页实际传输的字节数
+        chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        
+        return chrome_options
+    
+    def create_driver(self, for_login=False):
+        """
+        启动一个新的浏览器实例
+        
+        参数:
+            for_login: 用于手动登录时始终显示窗口、加载全部资源（验证码需要图片）
+        """
+        block_resources = self.block_resources and not for_login
+        chrome_options = self.create_chrome_options(self.headless and not for_login, block_resources)
+        
+        # 优先使用 webdriver-manager（驱动路径只解析一次，供所有实例复用）
+        if self.driver_path is None:
             try:
                 from webdriver_manager.chrome import ChromeDriverManager
-                service = Service(ChromeDriverManager().install())
-                self.driver = webdriver.Chrome(service=service, options=chrome_options)
-                print("✓ 使用 webdriver-manager 启动成功")
+                self.driver_path = ChromeDriverManager().install()
+                print("✓ 使用 webdriver-manager 获取驱动")
             except ImportError:
                 # 使用本地驱动
-                self.driver = webdriver.Chrome(options=chrome_options)
-                print("✓ 使用本地驱动启动成功")
-            
+                self.driver_path = ""
+                print("✓ 使用本地驱动")
+        
+        if self.driver_path:
+            driver = webdriver.Chrome(service=Service(self.driver_path), options=chrome_options)
+        else:
+            driver = webdriver.Chrome(options=chrome_options)
+        
+        # 设置超时
+        driver.set_page_load_timeout(30)
+        driver.implicitly_wait(10)
+        
+        if block_resources:
+            # 通过 DevTools 协议按URL拦截请求
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.BLOCKED_URL_PATTERNS})
+        
+        return driver
+    
+    def setup_driver(self, for_login=False):
+        """设置浏览器 - 使用独立的新实例"""
+        print("正在启动浏览器...")
+        
+        try:
+            self.driver = self.create_driver(for_login)
             print("✓ 浏览器已启动")
-            
-            # 设置超时
-            self.driver.set_page_load_timeout(30)
-            self.driver.implicitly_wait(10)
-            
             return True
             
         except Exception as e:
@@ -102,111 +530,625 @@ class SimpleTiebaDownloader:
         print("✓ 开始下载...")
         print()
     
-    def download_page(self, url):
-        """下载单个页面"""
+    # 轻量的登录状态检查接口：已登录时返回当前用户信息
+    PROBE_PATH = "/f/user/json_userinfo"
+    
+    def load_session(self):
+        """读取上次保存的登录会话，返回 (cookies, user_agent)，没有则返回 None"""
+        if not self.session_file.exists():
+            return None
+        try:
+            with open(self.session_file, 'r', encoding='utf-8') as f:
+                session = json.load(f)
+            return session['cookies'], session.get('user_agent')
+        except (ValueError, KeyError, OSError):
+            return None
+    
+    def save_session(self, cookies, user_agent):
+        """保存登录会话（文件中包含登录凭据，请勿分享）"""
+        with open(self.session_file, 'w', encoding='utf-8') as f:
+            json.dump({'cookies': cookies, 'user_agent': user_agent, 'saved': int(time.time())},
+                      f, ensure_ascii=False)
         try:
-            print(f"  访问中...", end='', flush=True)
-            self.driver.get(url)
+            os.chmod(self.session_file, 0o600)
+        except OSError:
+            pass
+    
+    def probe_session(self, cookies, user_agent, base_url="https://tieba.baidu.com"):
+        """用一次轻量HTTP请求检查保存的登录会话是否仍然有效"""
+        fetcher = HttpFetcher(cookies, base_url=base_url, user_agent=user_agent, timeout=10)
+        try:
+            status_code, text = fetcher.get(self.PROBE_PATH)
+        except Exception:
+            return False
+        finally:
+            fetcher.close()
+        
+        if status_code != 200:
+            return False
+        try:
+            info = json.loads(text)
+        except ValueError:
+            return False
+        return isinstance(info, dict) and bool(info.get('data'))
+    
+    def restore_session(self, base_url="https://tieba.baidu.com"):
+        """
+        尝试恢复上次保存的登录会话
+        返回 (cookies, user_agent)；没有保存或已失效时返回 None
+        """
+        session = self.load_session()
+        if session is None:
+            return None
+        
+        print("正在检查上次保存的登录状态...", end='', flush=True)
+        if self.probe_session(*session, base_url=base_url):
+            print(" ✓ 有效")
+            return session
+        
+        print(" 已失效，需要重新登录")
+        return None
+    
+    def apply_cookies(self, driver, cookies):
+        """把cookies写入浏览器"""
+        # 必须先打开同域页面才能写入cookies
+        driver.get("https://tieba.baidu.com")
+        for cookie in cookies:
+            try:
+                driver.add_cookie(cookie)
+            except Exception:
+                # 其他域（如passport.baidu.com）的cookie无法在此写入，跳过
+                pass
+    
+    def clone_driver(self):
+        """
+        启动一个额外的浏览器实例，并复制主浏览器的登录cookies
+        用于多线程下载，避免每个实例都手动登录
+        """
+        driver = self.create_driver()
+        self.apply_cookies(driver, self.driver.get_cookies())
+        return driver
+    
+    # 一次脚本调用判断页面状态，避免反复读取整个 page_source
+    PAGE_STATE_SCRIPT = """
+        if (document.getElementsByClassName('l_post').length) return 'post';
+        if (document.title.indexOf('404') >= 0) return 'dead';
+        // 删除提示只在页面文本中查找（与 dead_page.is_dead_page 相同，脚本中的文字不算）
+        var text = document.body ? document.body.innerText : '';
+        var markers = %s;
+        for (var i = 0; i < markers.length; i++) {
+            if (text.indexOf(markers[i]) >= 0) return 'dead';
+        }
+        var html = document.documentElement ? document.documentElement.innerHTML : '';
+        if (html.indexOf('请登录后继续操作') >= 0) return 'login';
+        return null;
+    """ % json.dumps(DELETED_MARKERS, ensure_ascii=False)
+    
+    def wait_for_page(self, driver, timeout=10):
+        """
+        等待页面出现帖子内容、404或登录墙，返回 'post' / 'dead' / 'login' / None（超时）
+        页面一就绪就返回，不再固定等待
+        """
+        try:
+            return WebDriverWait(driver, timeout, poll_frequency=0.2).until(
+                lambda d: d.execute_script(self.PAGE_STATE_SCRIPT)
+            )
+        except Exception:
+            return None
+    
+    @classmethod
+    def page_state(cls, html):
+        """
+        判断纯HTTP下载的页面状态（与 PAGE_STATE_SCRIPT 对应）
+        返回 'post' / 'dead' / 'login' / None
+        """
+        if 'l_post' in html:
+            return 'post'
+        if is_dead_page(html):
+            return 'dead'
+        if '请登录后继续操作' in html:
+            return 'login'
+        return None
+    
+    # "70回复贴，共2页"（数字外面带有 <span class="red"> 标签）
+    PAGE_COUNT_PATTERN = re.compile(r'回复贴，共\s*(?:<[^>]*>\s*)*(\d+)\s*(?:<[^>]*>\s*)*页')
+    
+    @classmethod
+    def page_count(cls, html):
+        """从帖子首页读取总页数，找不到时返回 1"""
+        match = cls.PAGE_COUNT_PATTERN.search(html)
+        return max(int(match.group(1)), 1) if match else 1
+    
+    @staticmethod
+    def split_page_url(url):
+        """拆分帖子URL，返回 (帖子ID, 页码)"""
+        parts = urlsplit(url)
+        post_id = url.split('/p/')[-1].split('?')[0]
+        pn = parse_qs(parts.query).get('pn', ['1'])[0]
+        return post_id, int(pn) if pn.isdigit() else 1
+    
+    @staticmethod
+    def page_urls(url, pages):
+        """帖子第2页到最后一页的URL"""
+        base = url.split('?')[0]
+        return [f"{base}?pn={k}" for k in range(2, pages + 1)]
+    
+    def pending_page_urls(self, url):
+        """已下载的帖子首页中，尚未下载（也未确认删除）的分页URL"""
+        return [u for u in self.page_urls(url, self.progress.pages(url))
+                if self.progress.status(u) not in ('ok', 'dead')]
+    
+    def take_discovered(self):
+        """取走目前为止新发现的分页URL"""
+        urls = []
+        while True:
+            try:
+                urls.append(self.discovered.get_nowait())
+            except queue.Empty:
+                return urls
+    
+    def zstd_compressor(self, data):
+        """
+        当前线程的zst压缩器
+        第一次压缩时把该页面保存为压缩字典，之后的页面只需保存与字典不同的部分
+        """
+        compressor = getattr(self.zstd_local, 'compressor', None)
+        if compressor:
+            return compressor
+        
+        with self.zstd_lock:
+            if self.zstd_dict is None:
+                dict_file = self.output_dir / self.ZSTD_DICT_NAME
+                if not dict_file.exists():
+                    # 字典写入后不能再改动，否则已保存的文件无法解压
+                    with open(dict_file, 'wb') as f:
+                        f.write(data)
+                with open(dict_file, 'rb') as f:
+                    self.zstd_dict = zstandard.ZstdCompressionDict(
+                        f.read(), dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        
+        compressor = zstandard.ZstdCompressor(level=self.ZSTD_LEVEL, dict_data=self.zstd_dict)
+        self.zstd_local.compressor = compressor
+        return compressor
+    
+    def encode_page(self, html):
+        """按压缩设置把HTML转换为要写入文件的字节"""
+        data = html.encode('utf-8')
+        if self.compress == 'gz':
+            return gzip.compress(data)
+        if self.compress == 'zst':
+            return self.zstd_compressor(data).compress(data)
+        return data
+    
+    def save_page(self, url, html):
+        """
+        保存HTML并记录进度
+        首页保存为 <id>.html，第k页保存为 <id>_pn<k>.html（压缩时为 .html.gz / .html.zst）；
+        首页会读取总页数，把其余分页加入下载队列
+        """
+        post_id, pn = self.split_page_url(url)
+        
+        stem = post_id if pn == 1 else f"{post_id}_pn{pn}"
+        html_file = self.output_dir / (stem + self.HTML_SUFFIXES[self.compress])
+        with open(html_file, 'wb') as f:
+            f.write(self.encode_page(html))
+        
+        # 记录进度
+        if pn == 1:
+            pages = self.page_count(html)
+            self.progress.record(url, 'ok', size=html_file.stat().st_size, pages=pages)
+            for page_url in self.pending_page_urls(url):
+                self.discovered.put(page_url)
+        else:
+            self.progress.record(url, 'ok', size=html_file.stat().st_size)
+        
+        if self.on_page_saved:
+            self.on_page_saved(url, html)
+    
+    def handle_state(self, url, state):
+        """
+        处理登录墙和404页面
+        返回 (状态, 结果说明)；页面正常时返回 None
+        """
+        # 检查是否需要登录
+        if state == 'login':
+            self.progress.record(url, 'login')
+            return 'login', "需要登录！"
+        
+        # 帖子已删除时贴吧会跳转到404页面
+        if state == 'dead':
+            self.progress.record(url, 'dead')
+            return 'dead', "帖子已删除(404)，以后跳过"
+        
+        return None
+    
+    # 一次脚本调用取出标题、描述、回复数/页数和所有楼层
+    COMPACT_SCRIPT = """
+        var meta = document.querySelector('meta[name="description"]');
+        var replyNum = document.querySelector('li.l_reply_num');
+        var posts = document.getElementsByClassName('l_post');
+        var html = [];
+        for (var i = 0; i < posts.length; i++) html.push(posts[i].outerHTML);
+        return {
+            title: document.title,
+            description: meta ? meta.getAttribute('content') : '',
+            reply_num: replyNum ? replyNum.outerHTML : '',
+            posts: html
+        };
+    """
+    
+    def capture_compact(self, driver):
+        """
+        只提取帖子标题、meta描述和 l_post 楼层，拼成精简的HTML
+        页面里找不到楼层时返回 None（改为保存完整页面）
+        """
+        data = driver.execute_script(self.COMPACT_SCRIPT)
+        if not data or not data.get('posts'):
+            return None
+        
+        return (
+            '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+            f'<title>{html_lib.escape(data.get("title") or "")}</title>'
+            f'<meta name="description" content="{html_lib.escape(data.get("description") or "")}">'
+            '</head>\n<body>\n'
+            f'<ul class="l_posts_num">{data.get("reply_num") or ""}</ul>\n'
+            '<div id="j_p_postlist">\n' + '\n'.join(data['posts']) + '\n</div>\n'
+            '</body></html>\n'
+        )
+    
+    def page_bytes(self, driver):
+        """
+        读取并清空浏览器性能日志，统计期间实际通过网络传输的字节数
+        无法读取时返回 None
+        """
+        try:
+            entries = driver.get_log("performance")
+        except Exception:
+            return None
+        
+        total = 0
+        for entry in entries:
+            if '"Network.loadingFinished"' not in entry['message']:
+                continue
+            message = json.loads(entry['message'])['message']
+            total += message['params'].get('encodedDataLength', 0)
+        return total
+    
+    def fetch_page(self, driver, url):
+        """
+        用指定浏览器下载单个页面
+        
+        返回: (状态, 结果说明)
+            状态为 'ok' / 'dead' / 'login' / 'failed'
+        """
+        try:
+            # 清空上一页留下的性能日志
+            self.page_bytes(driver)
+            
+            driver.get(url)
             
             # 等待页面加载
-            time.sleep(2)
+            state = self.wait_for_page(driver)
             
-            # 检查是否需要登录
-            if "登录" in self.driver.page_source and "请登录后继续操作" in self.driver.page_source:
-                print(" 需要登录！")
-                return False
+            # 统计本页传输量
+            transferred = self.page_bytes(driver)
+            size_note = ""
+            if transferred is not None:
+                with self.print_lock:
+                    self.transferred += transferred
+                size_note = f" {transferred / 1024:.0f}KB"
             
-            # 等待主要内容
-            try:
-                WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, "l_post"))
-                )
-            except:
-                pass
+            handled = self.handle_state(url, state)
+            if handled:
+                return handled[0], handled[1] + size_note
             
-            # 保存HTML
-            html = self.driver.page_source
-            post_id = url.split('/p/')[-1].split('?')[0]
+            # 保存HTML（精简模式只保存正文区域）
+            html = self.capture_compact(driver) if self.compact else None
+            self.save_page(url, html or driver.page_source)
             
-            html_file = self.output_dir / f"{post_id}.html"
-            with open(html_file, 'w', encoding='utf-8') as f:
-                f.write(html)
+            return 'ok', "✓" + size_note
             
-            # 记录进度
-            self.downloaded.add(url)
-            self.save_progress()
+        except Exception as e:
+            self.progress.record(url, 'failed', error=e)
+            return 'failed', f"❌ {e}"
+    
+    def fetch_page_http(self, fetcher, url):
+        """
+        用纯HTTP下载单个页面
+        
+        返回: (状态, 结果说明)
+        """
+        try:
+            status_code, html = fetcher.get(url)
             
-            print(" ✓", flush=True)
-            return True
+            if status_code == 404:
+                state = 'dead'
+            elif status_code != 200:
+                self.progress.record(url, 'failed', error=f"HTTP {status_code}")
+                return 'failed', f"❌ HTTP {status_code}"
+            else:
+                state = self.page_state(html)
+            
+            handled = self.handle_state(url, state)
+            if handled:
+                return handled
+            
+            # 保存HTML
+            self.save_page(url, html)
+            
+            return 'ok', "✓"
             
         except Exception as e:
-            print(f" ❌ {e}", flush=True)
-            return False
+            self.progress.record(url, 'failed', error=e)
+            return 'failed', f"❌ {e}"
+    
+    def fetch_with_limiter(self, fetch, url, limiter):
+        """
+        按速率控制下载单个页面，并把结果反馈给速率控制器
+        
+        参数:
+            fetch: 下载函数，接收URL，返回 (状态, 结果说明)
+        返回: (状态, 结果说明)
+        """
+        limiter.wait()
+        started = time.monotonic()
+        status, message = fetch(url)
+        load_time = time.monotonic() - started
+        
+        backoff = limiter.report(status, load_time)
+        message = f"{message} ({load_time:.1f}s)"
+        if backoff:
+            message += f" ⚠️ 退避 {backoff:.0f} 秒，速率降至 {limiter.current_rate():.1f} 次/分钟"
+        return status, message
+    
+    def download_page(self, fetch, url, limiter):
+        """下载单个页面"""
+        print(f"  访问中...", end='', flush=True)
+        status, message = self.fetch_with_limiter(fetch, url, limiter)
+        print(f" {message}", flush=True)
+        return status == 'ok'
+    
+    def start_extra_drivers(self, count):
+        """启动额外的浏览器实例（复制主浏览器的登录状态）"""
+        print(f"正在启动额外的 {count} 个浏览器实例...")
+        drivers = []
+        for n in range(2, count + 2):
+            try:
+                drivers.append(self.clone_driver())
+                print(f"  ✓ 实例 {n} 已就绪")
+            except Exception as e:
+                print(f"  ❌ 实例 {n} 启动失败: {e}")
+        print(f"✓ 共 {len(drivers) + 1} 个浏览器实例参与下载")
+        print()
+        return drivers
+    
+    def export_session(self):
+        """导出浏览器当前的登录cookies和User-Agent，供纯HTTP下载使用"""
+        cookies = self.driver.get_cookies()
+        user_agent = self.driver.execute_script("return navigator.userAgent")
+        return cookies, user_agent
+    
+    def download_parallel(self, urls, fetchers, limiter):
+        """
+        多线程并发下载
+        
+        参数:
+            urls: 待下载的URL列表
+            fetchers: 每个工作线程使用的下载函数（接收URL，返回 (状态, 结果说明)）
+            limiter: 全局自适应速率控制器
+        返回:
+            (成功数, 失败数)
+        """
+        tasks = queue.Queue()
+        for url in urls:
+            tasks.put(url)
+        
+        # total 会随着发现新的分页而增加；pending 为尚未完成的任务数
+        stats = {'done': 0, 'success': 0, 'failed': 0, 'total': len(urls), 'pending': len(urls)}
+        stop = threading.Event()
+        
+        def worker(worker_id, fetch):
+            while not stop.is_set():
+                try:
+                    url = tasks.get(timeout=0.2)
+                except queue.Empty:
+                    # 队列暂时为空，但其他线程可能还会发现新的分页
+                    with self.print_lock:
+                        if stats['pending'] == 0:
+                            return
+                    continue
+                
+                # 出错的任务也要计入完成，否则 pending 永远不为 0，其他线程会一直等下去
+                try:
+                    status, message = self.fetch_with_limiter(fetch, url, limiter)
+                    new_pages = self.take_discovered()
+                except Exception as e:
+                    status, message = 'failed', f"❌ {e}"
+                    new_pages = []
+                ok = status == 'ok'
+                
+                with self.print_lock:
+                    # 新发现的分页交给所有线程并发下载
+                    for page_url in new_pages:
+                        tasks.put(page_url)
+                    stats['total'] += len(new_pages)
+                    stats['pending'] += len(new_pages) - 1
+                    
+                    stats['done'] += 1
+                    stats['success' if ok else 'failed'] += 1
+                    if new_pages:
+                        message += f"（还有 {len(new_pages)} 页已加入队列）"
+                    print(f"[{stats['done']}/{stats['total']}] #{worker_id} {url} {message}", flush=True)
+                    
+                    # 显示进度
+                    if stats['done'] % 10 == 0:
+                        print()
+                        print(f"  进度: {stats['done']}/{stats['total']}, 成功: {stats['success']}, 失败: {stats['failed']}"
+                              f", 速率: {limiter.effective_rate():.1f} 次/分钟")
+                        print()
+        
+        threads = [
+            threading.Thread(target=worker, args=(i, f), daemon=True)
+            for i, f in enumerate(fetchers, 1)
+        ]
+        
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                while t.is_alive():
+                    t.join(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            raise
+        
+        return stats['success'], stats['failed']
     
-    def run(self, urls_file, delay=3):
-        """主运行函数"""
+    def run(self, urls_file, delay=3, workers=1, max_per_minute=None,
+            mode='browser', base_url="https://tieba.baidu.com"):
+        """
+        主运行函数
+        
+        参数:
+            urls_file: URL列表文件
+            delay: 初始请求间隔秒数（之后由自适应速率控制自动调整）
+            workers: 并发数量（浏览器模式为浏览器实例数，HTTP模式为连接数），1 表示顺序下载
+            max_per_minute: 全局每分钟请求数上限，None 表示不限
+            mode: 'browser' 每页用浏览器渲染；'http' 登录后关闭浏览器，用纯HTTP下载
+            base_url: HTTP模式请求的站点地址
+        """
         # 读取URL
         with open(urls_file, 'r', encoding='utf-8') as f:
             urls = [line.strip() for line in f if line.strip()]
         
         print(f"✓ 找到 {len(urls)} 个URL")
         
-        # 过滤已下载
-        remaining = [url for url in urls if url not in self.downloaded]
+        # 过滤已下载和已确认删除的帖子
+        remaining = [url for url in urls if self.progress.status(url) not in ('ok', 'dead')]
+        dead = sum(1 for url in urls if self.progress.status(url) == 'dead')
         
-        if not remaining:
+        # 已下载首页的多页帖子，补上还没下载的分页
+        extra_pages = []
+        for url in urls:
+            if self.progress.status(url) == 'ok':
+                extra_pages.extend(self.pending_page_urls(url))
+        
+        if not remaining and not extra_pages:
             print("✓ 所有页面已下载！")
+            self.progress.close()
             return
         
-        print(f"✓ 已完成 {len(urls) - len(remaining)} 个")
+        print(f"✓ 已完成 {len(urls) - len(remaining) - dead} 个")
+        if dead:
+            print(f"✓ 跳过已删除 {dead} 个")
         print(f"✓ 还需下载 {len(remaining)} 个")
+        if extra_pages:
+            print(f"✓ 另有 {len(extra_pages)} 个分页待下载")
+        remaining.extend(extra_pages)
         print()
         
-        # 启动浏览器
-        if not self.setup_driver():
+        # 优先复用上次保存的登录会话
+        session = self.restore_session(base_url)
+        
+        # 启动浏览器（HTTP模式且会话有效时完全不需要浏览器）
+        # 需要手动登录时必须显示窗口
+        if (mode != 'http' or session is None) and not self.setup_driver(for_login=session is None):
+            self.progress.close()
             return
         
+        extra_drivers = []
+        fetcher = None
+        
         try:
-            # 先访问百度，等待登录
-            print("正在打开百度贴吧...")
-            self.driver.get("https://tieba.baidu.com")
-            time.sleep(2)
+            if session is None:
+                # 先访问百度，等待登录
+                print("正在打开百度贴吧...")
+                self.driver.get("https://tieba.baidu.com")
+                time.sleep(2)
+                
+                # 等待用户登录
+                self.wait_for_login()
+                
+                # 保存登录会话，下次运行无需手动登录
+                session = self.export_session()
+                self.save_session(*session)
+                print(f"✓ 登录状态已保存到 {self.session_file.name}，下次运行将自动登录")
+                print()
+                
+                if (self.headless or self.block_resources) and mode != 'http':
+                    # 登录完成后换成轻量浏览器继续下载
+                    login_driver = self.driver
+                    self.driver = self.create_driver()
+                    self.apply_cookies(self.driver, session[0])
+                    login_driver.quit()
+                    print("✓ 已切换到轻量模式浏览器")
+                    print()
+            elif self.driver:
+                self.apply_cookies(self.driver, session[0])
+                print("✓ 已恢复登录状态，跳过手动登录")
+                print()
+            
+            if mode == 'http':
+                # 导出登录状态后关闭浏览器，之后全部用HTTP下载
+                cookies, user_agent = session
+                if self.driver:
+                    self.driver.quit()
+                    self.driver = None
+                fetcher = HttpFetcher(cookies, base_url=base_url, user_agent=user_agent)
+                fetchers = [lambda url: self.fetch_page_http(fetcher, url)] * workers
+                print(f"✓ 使用 {len(cookies)} 个cookies，改用HTTP直连下载（不启动浏览器渲染）")
+                print()
+            else:
+                if workers > 1:
+                    extra_drivers = self.start_extra_drivers(workers - 1)
+                fetchers = [
+                    (lambda url, driver=driver: self.fetch_page(driver, url))
+                    for driver in [self.driver] + extra_drivers
+                ]
             
-            # 等待用户登录
-            self.wait_for_login()
+            # 初始间隔按并发数量平摊，之后根据页面加载情况自动调整
+            limiter = AdaptiveRateLimiter(delay / max(workers, 1), max_per_minute)
             
             # 开始下载
             print("="*60)
             print(f"开始下载 {len(remaining)} 个页面")
-            print(f"预计时间: {len(remaining) * delay / 60:.1f} 分钟")
+            print(f"预计时间: {len(remaining) * limiter.interval / 60:.1f} 分钟（速率会自动调整）")
             print("="*60)
             print()
             
             success = 0
             failed = 0
             
-            for i, url in enumerate(remaining, 1):
-                print(f"[{i}/{len(remaining)}] {url}", end='')
-                
-                if self.download_page(url):
-                    success += 1
-                else:
-                    failed += 1
-                
-                # 显示进度
-                if i % 10 == 0:
-                    print()
-                    print(f"  进度: {i}/{len(remaining)}, 成功: {success}, 失败: {failed}")
-                    print()
-                
-                # 延迟
-                time.sleep(delay)
+            if workers > 1:
+                success, failed = self.download_parallel(remaining, fetchers, limiter)
+            else:
+                # 新发现的分页追加到列表末尾，循环会继续处理
+                for i, url in enumerate(remaining, 1):
+                    print(f"[{i}/{len(remaining)}] {url}", end='')
+                    
+                    if self.download_page(fetchers[0], url, limiter):
+                        success += 1
+                    else:
+                        failed += 1
+                    remaining.extend(self.take_discovered())
+                    
+                    # 显示进度
+                    if i % 10 == 0:
+                        print()
+                        print(f"  进度: {i}/{len(remaining)}, 成功: {success}, 失败: {failed}"
+                              f", 速率: {limiter.effective_rate():.1f} 次/分钟")
+                        print()
             
             print()
             print("="*60)
             print("✓ 下载完成！")
             print(f"  成功: {success}")
             print(f"  失败: {failed}")
+            print(f"  实际平均速率: {limiter.effective_rate():.1f} 次/分钟")
+            print(f"  最终稳定速率: {limiter.current_rate():.1f} 次/分钟")
+            if self.transferred:
+                print(f"  浏览器共传输: {self.transferred / 1024 / 1024:.1f} MB"
+                      f"（平均每页 {self.transferred / 1024 / max(success, 1):.0f} KB）")
             print(f"  保存位置: {self.output_dir.absolute()}")
             print("="*60)
             
@@ -216,6 +1158,14 @@ class SimpleTiebaDownloader:
             print("进度已保存，下次运行将继续")
         
         finally:
+            self.progress.close()
+            for driver in extra_drivers:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+            if fetcher:
+                fetcher.close()
             if self.driver:
                 self.driver.quit()
 
@@ -233,12 +1183,39 @@ def main():
     
     # 设置参数
     output_dir = input("保存位置（直接回车: downloaded_html）: ").strip() or "downloaded_html"
-    delay = input("间隔秒数（直接回车: 3秒）: ").strip()
+    delay = input("初始间隔秒数（直接回车: 3秒，运行中自动调整）: ").strip()
     delay = float(delay) if delay else 3.0
+    print("下载方式：")
+    print("  1 = 浏览器逐页打开（默认，最稳妥）")
+    print("  2 = HTTP直连（只用浏览器登录一次，之后关闭浏览器直接下载，更快更省资源）")
+    mode = 'http' if input("请选择（直接回车: 1）: ").strip() == '2' else 'browser'
+    workers = input("并发数量（浏览器数量或HTTP连接数，直接回车: 1）: ").strip()
+    workers = max(int(workers), 1) if workers else 1
+    max_per_minute = input("全局每分钟最多请求数（直接回车: 不限）: ").strip()
+    max_per_minute = float(max_per_minute) if max_per_minute else None
+    lite = False
+    compact = False
+    if mode == 'browser':
+        lite = input("轻量模式？无窗口运行，不加载图片/字体/视频/广告 (y/n，直接回车: n): ").strip().lower() == 'y'
+        compact = input("只保存帖子正文区域？文件更小、后续处理更快 (y/n，直接回车: n): ").strip().lower() == 'y'
+    print("压缩保存：")
+    print("  0 = 不压缩（默认）")
+    print("  1 = gz（约缩小到 1/5，无需额外安装）")
+    print("  2 = zst（约缩小到 1/20 以下，需要 pip install zstandard）")
+    compress = {'1': 'gz', '2': 'zst'}.get(input("请选择（直接回车: 0）: ").strip())
     
     print()
     print(f"✓ 保存到: {output_dir}/")
-    print(f"✓ 间隔: {delay} 秒")
+    print(f"✓ 初始间隔: {delay} 秒")
+    print(f"✓ 下载方式: {'HTTP直连' if mode == 'http' else '浏览器'}")
+    print(f"✓ 并发数量: {workers}")
+    if lite:
+        print("✓ 轻量模式: 无窗口 + 拦截图片/字体/视频/广告")
+    if compact:
+        print("✓ 只保存帖子正文区域")
+    if compress:
+        print(f"✓ 压缩保存为 .html.{compress}")
+    print(f"✓ 速率上限: {f'{max_per_minute:g} 次/分钟' if max_per_minute else '不限'}")
     print()
     
     confirm = input("确认开始？(y/n): ").strip().lower()
@@ -249,8 +1226,9 @@ def main():
     print()
     
     # 开始
-    downloader = SimpleTiebaDownloader(output_dir=output_dir)
-    downloader.run("urls.txt", delay=delay)
+    downloader = SimpleTiebaDownloader(output_dir=output_dir, headless=lite, block_resources=lite,
+                                       compact=compact, compress=compress)
+    downloader.run("urls.txt", delay=delay, workers=workers, max_per_minute=max_per_minute, mode=mode)
     
     print()
     input("按回车退出...")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+贴吧帖子URL采集器
+代替在浏览器控制台粘贴JavaScript的手动采集方式：
+使用已登录的会话翻页读取个人主页的发帖列表，把新发现的帖子URL直接追加到 urls.txt
+"""
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from download_html_simple import SimpleTiebaDownloader, HttpFetcher
+
+
+# 个人主页「我的贴子」列表，{pn} 为页码
+DEFAULT_LISTING_URL = "https://tieba.baidu.com/i/i/my_tie?&pn={pn}"
+
+POST_LINK_PATTERN = re.compile(r'/p/(\d+)')
+
+
+def post_url(post_id):
+    """帖子ID转为标准URL"""
+    return f"https://tieba.baidu.com/p/{post_id}"
+
+
+class TiebaUrlHarvester:
+    def __init__(self, urls_file="urls.txt", output_dir="downloaded_html",
+                 listing_url=DEFAULT_LISTING_URL):
+        self.urls_file = Path(urls_file)
+        self.listing_url = listing_url
+        parts = urlsplit(listing_url)
+        self.base_url = f"{parts.scheme}://{parts.netloc}"
+        # 复用下载器的登录会话和进度记录
+        self.downloader = SimpleTiebaDownloader(output_dir=output_dir)
+        self.known = self.load_known_ids()
+    
+    def load_known_ids(self):
+        """已在 urls.txt 或下载进度中出现过的帖子ID"""
+        known = set()
+        if self.urls_file.exists():
+            with open(self.urls_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    match = POST_LINK_PATTERN.search(line)
+                    if match:
+                        known.add(match.group(1))
+        for url in self.downloader.progress.records:
+            match = POST_LINK_PATTERN.search(url)
+            if match:
+                known.add(match.group(1))
+        return known
+    
+    def login(self):
+        """
+        取得登录会话：优先使用下载器保存的会话，失效时打开浏览器手动登录
+        返回 (cookies, user_agent)，失败返回 None
+        """
+        session = self.downloader.restore_session(self.base_url)
+        if session:
+            return session
+        
+        if not self.downloader.setup_driver(for_login=True):
+            return None
+        try:
+            self.downloader.driver.get("https://tieba.baidu.com")
+            time.sleep(2)
+            self.downloader.wait_for_login()
+            session = self.downloader.export_session()
+            self.downloader.save_session(*session)
+            return session
+        finally:
+            self.downloader.driver.quit()
+            self.downloader.driver = None
+    
+    def fetch_listing(self, fetcher, pn):
+        """
+        读取一页发帖列表
+        返回: 按页面顺序排列、去重后的帖子ID列表；请求失败返回 None
+        """
+        try:
+            status_code, html = fetcher.get(self.listing_url.format(pn=pn))
+        except Exception as e:
+            print(f"  ❌ 第{pn}页读取失败: {e}")
+            return None
+        if status_code != 200:
+            print(f"  ❌ 第{pn}页读取失败: HTTP {status_code}")
+            return None
+        
+        ids = []
+        seen = set()
+        for post_id in POST_LINK_PATTERN.findall(html):
+            if post_id not in seen:
+                seen.add(post_id)
+                ids.append(post_id)
+        
+        if not ids and '请登录后继续操作' in html:
+            print(f"  ❌ 第{pn}页需要登录")
+            return None
+        return ids
+    
+    def harvest(self, workers=4, max_pages=None, full=False, start_page=1):
+        """
+        并发翻页采集帖子URL
+        
+        参数:
+            workers: 同时读取的列表页数量
+            max_pages: 最多读取的页数，None 表示直到列表结束
+            full: True 时读取全部页面；False 时遇到整页都是已知帖子就停止（增量采集）
+            start_page: 起始页码
+        返回:
+            新发现的帖子URL列表（按列表顺序）
+        """
+        session = self.login()
+        if session is None:
+            print("❌ 无法登录，已取消")
+            return []
+        
+        fetcher = HttpFetcher(session[0], base_url=self.base_url, user_agent=session[1])
+        new_ids = []
+        found = set()
+        pn = start_page
+        
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while max_pages is None or pn < start_page + max_pages:
+                    # 一批同时读取 workers 页
+                    batch = list(range(pn, pn + workers))
+                    if max_pages is not None:
+                        batch = [n for n in batch if n < start_page + max_pages]
+                    results = list(pool.map(lambda n: self.fetch_listing(fetcher, n), batch))
+                    pn = batch[-1] + 1
+                    
+                    stop = False
+                    for n, ids in zip(batch, results):
+                        if ids is None or not ids:
+                            # 读取失败或已经翻到列表末尾
+                            stop = True
+                            break
+                        
+                        fresh = [i for i in ids if i not in self.known and i not in found]
+                        found.update(fresh)
+                        new_ids.extend(fresh)
+                        print(f"  第{n}页: {len(ids)} 个帖子，新增 {len(fresh)} 个")
+                        
+                        # 增量采集：整页都是已知帖子，说明已经接上上次的进度
+                        if not full and not fresh:
+                            stop = True
+                            break
+                    
+                    if stop:
+                        break
+        finally:
+            fetcher.close()
+            self.downloader.progress.close()
+        
+        return [post_url(i) for i in new_ids]
+    
+    def append_urls(self, urls):
+        """把新URL追加到 urls.txt（下载器的待下载队列）"""
+        if not urls:
+            return
+        needs_newline = False
+        if self.urls_file.exists() and self.urls_file.stat().st_size:
+            with open(self.urls_file, 'rb') as f:
+                f.seek(-1, 2)
+                needs_newline = f.read(1) != b'\n'
+        with open(self.urls_file, 'a', encoding='utf-8') as f:
+            if needs_newline:
+                f.write('\n')
+            for url in urls:
+                f.write(url + '\n')
+        self.known.update(POST_LINK_PATTERN.search(url).group(1) for url in urls)
+
+
+def main():
+    print("="*60)
+    print("贴吧帖子URL采集器")
+    print("="*60)
+    print()
+    
+    # 设置参数
+    urls_file = input("URL列表文件（直接回车: urls.txt）: ").strip() or "urls.txt"
+    output_dir = input("下载器保存位置，用于复用登录状态（直接回车: downloaded_html）: ").strip() or "downloaded_html"
+    print(f"发帖列表地址（直接回车: {DEFAULT_LISTING_URL}）")
+    listing_url = input("> ").strip() or DEFAULT_LISTING_URL
+    workers = input("同时读取的页数（直接回车: 4）: ").strip()
+    workers = max(int(workers), 1) if workers else 4
+    full = input("完整采集所有页面？(y/n，直接回车: n，遇到已采集的帖子就停止): ").strip().lower() == 'y'
+    
+    print()
+    harvester = TiebaUrlHarvester(urls_file=urls_file, output_dir=output_dir, listing_url=listing_url)
+    print(f"✓ 已知帖子: {len(harvester.known)} 个")
+    print()
+    
+    urls = harvester.harvest(workers=workers, full=full)
+    harvester.append_urls(urls)
+    
+    print()
+    print("="*60)
+    print(f"✓ 新增 {len(urls)} 个帖子URL")
+    if urls:
+        print(f"  已追加到: {Path(urls_file).absolute()}")
+        print("  运行 download_html_simple.py 即可下载")
+    print("="*60)
+    
+    print()
+    input("按回车退出...")
+
+
+if __name__ == "__main__":
+    main()
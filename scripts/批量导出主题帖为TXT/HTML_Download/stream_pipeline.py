@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+贴吧帖子流水线处理：下载 → 转TXT → 关键词清洗 同时进行
+每下载完一个页面就放进有界队列，转换和清洗线程边下载边处理，
+不必等全部下载完再分别运行 html_to_txt_v2.py 和 tieba_text_cleanerV2.py。
+队列满时下载线程会等待后续步骤跟上，内存占用不会随帖子数量增长。
+"""
+
+import importlib.util
+import queue
+import threading
+import time
+from pathlib import Path
+
+from download_html_simple import SimpleTiebaDownloader
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent.parent
+CONVERTER_PATH = SCRIPTS_DIR / "批量导出主题帖为TXT" / "HTML_to_TXT" / "html_to_txt_v2.py"
+CLEANER_PATH = SCRIPTS_DIR / "关键词清洗" / "02_clearerV2" / "tieba_text_cleanerV2.py"
+
+# 队列结束标记
+DONE = None
+
+
+def load_module(name, path):
+    """按文件路径加载同仓库中的其它脚本"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ThreadFileWriter:
+    """
+    把同一帖子的各页文本按页码顺序写入 <帖子ID>.txt
+    从首页开始写（覆盖旧文件）；先到的后续分页暂存，等前面的页写完再写，
+    所以写出的文件总是以首页的标题开头，不会接在旧文件后面
+    """
+    
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.next_page = {}
+        self.pending = {}
+        self.bars = {}
+        self.files = 0
+    
+    def add(self, post_id, pn, text, bar=None):
+        """
+        加入一页文本；text 为 None 表示该页被跳过（404或内容过短）
+        bar: 首页标题中的吧名，记录下来随后续分页一起返回
+        返回: 本次按顺序写出的页面 [(页码, 文本, 吧名)]，首页没到之前总是为空
+        """
+        with self.lock:
+            # 首页被跳过的帖子整个不输出（与 html_to_txt_v2.py 相同）
+            if self.next_page.get(post_id, 1) is None:
+                return []
+            if pn == 1:
+                self.bars[post_id] = bar
+            self.pending.setdefault(post_id, {})[pn] = text
+            return self.flush_ready(post_id)
+    
+    def flush_ready(self, post_id, force=False):
+        """写出已经连续的页面；force 为 True 时跳过中间缺失的页面全部写出"""
+        pages = self.pending[post_id]
+        pn = self.next_page.get(post_id, 1)
+        written = []
+        if pn == 1 and pages.get(1, '') is None:
+            pages.clear()
+            self.next_page[post_id] = None
+            return written
+        while pages and (pn in pages or (force and pn > 1)):
+            if pn not in pages:
+                pn = min(pages)
+            text = pages.pop(pn)
+            if text is not None:
+                output_path = self.output_dir / f"{post_id}.txt"
+                if pn == 1:
+                    self.files += 1
+                with open(output_path, 'w' if pn == 1 else 'a', encoding='utf-8') as f:
+                    f.write(text)
+            written.append((pn, text, self.bars.get(post_id)))
+            pn += 1
+        self.next_page[post_id] = pn
+        return written
+    
+    def close(self):
+        """
+        写出因前面分页下载失败而一直在等待的页面
+        返回: (写出的页面 [(帖子ID, 页码, 文本, 吧名)], 本次没有收到首页的帖子ID列表)
+        """
+        written = []
+        missing_first = []
+        with self.lock:
+            for post_id in list(self.pending):
+                next_page = self.next_page.get(post_id, 1)
+                if next_page is None:
+                    continue
+                if next_page == 1:
+                    if self.pending.pop(post_id):
+                        missing_first.append(post_id)
+                    continue
+                written.extend((post_id,) + page for page in self.flush_ready(post_id, force=True))
+        return written, missing_first
+
+
+class StreamPipeline:
+    def __init__(self, output_dir="downloaded_html", txt_dir="txt_files", cleaned_dir="cleaned_txt",
+                 parse_workers=2, clean_workers=1, queue_size=16, **downloader_options):
+        """
+        参数:
+            output_dir: HTML保存位置（同下载器）
+            txt_dir: 转换后的TXT保存位置
+            cleaned_dir: 清洗后的TXT保存位置
+            parse_workers: HTML转TXT线程数
+            clean_workers: 清洗线程数
+            queue_size: 每个队列最多暂存的页面数，队列满时上一步会等待
+            downloader_options: 传给 SimpleTiebaDownloader 的其它参数
+        """
+        self.converter = load_module("html_to_txt_v2", CONVERTER_PATH)
+        self.cleaner = load_module("tieba_text_cleanerV2", CLEANER_PATH)
+        # 与单独运行清洗脚本相同：内置规则 + rules 目录中的规则文件
+        self.patterns = self.cleaner.load_rules()
+        
+        self.downloader = SimpleTiebaDownloader(output_dir=output_dir, **downloader_options)
+        self.downloader.on_page_saved = self.enqueue_page
+        
+        self.parse_workers = parse_workers
+        self.clean_workers = clean_workers
+        self.html_queue = queue.Queue(maxsize=queue_size)
+        self.text_queue = queue.Queue(maxsize=queue_size)
+        self.txt_writer = ThreadFileWriter(txt_dir)
+        self.cleaned_writer = ThreadFileWriter(cleaned_dir)
+        
+        self.stats_lock = threading.Lock()
+        self.stats = {'parsed': 0, 'skipped': 0, 'cleaned': 0, 'errors': 0}
+        self.started = None
+        self.first_cleaned = None
+    
+    def enqueue_page(self, url, html):
+        """下载器每保存一个页面调用一次；队列满时阻塞下载线程（反压）"""
+        post_id, pn = self.downloader.split_page_url(url)
+        self.html_queue.put((post_id, pn, html))
+    
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+    
+    def convert(self, pn, html):
+        """转换一页HTML；后续分页不带标题，前面加上分页标记"""
+        content = self.converter.convert_html(html, include_header=pn == 1)
+        if content is None or (pn == 1 and len(content) < 50):
+            return None
+        if pn > 1:
+            content = self.converter.page_separator(pn) + content
+        return content
+    
+    def parse_worker(self):
+        """HTML → TXT"""
+        while True:
+            item = self.html_queue.get()
+            if item is DONE:
+                break
+            post_id, pn, html = item
+            try:
+                text = self.convert(pn, html)
+            except Exception as e:
+                text = None
+                self.count('errors')
+                print(f"\n  ✗ 转换失败 {post_id} 第{pn}页: {e}")
+            self.count('parsed' if text is not None else 'skipped')
+            # 后续分页没有标题行，带作用范围的规则按首页的吧名判断；
+            # txt_writer 等首页写出后才按顺序放出后续分页，吧名随页面一起交给清洗线程
+            bar = self.cleaner.detect_bar(text) if pn == 1 and text is not None else None
+            for page, page_text, page_bar in self.txt_writer.add(post_id, pn, text, bar):
+                self.text_queue.put((post_id, page, page_text, page_bar))
+    
+    def clean_worker(self):
+        """TXT → 清洗后的TXT"""
+        while True:
+            item = self.text_queue.get()
+            if item is DONE:
+                break
+            post_id, pn, text, bar = item
+            if text is not None:
+                try:
+                    text = self.cleaner.clean_text(text, self.patterns, bar=bar)
+                    self.count('cleaned')
+                except Exception as e:
+                    text = None
+                    self.count('errors')
+                    print(f"\n  ✗ 清洗失败 {post_id} 第{pn}页: {e}")
+            written = self.cleaned_writer.add(post_id, pn, text)
+            if self.first_cleaned is None and any(page_text is not None for _, page_text, _ in written):
+                self.first_cleaned = time.time()
+    
+    def rebuild_thread(self, post_id):
+        """
+        首页在之前的运行中已下载、本次只下载了后续分页的帖子：
+        用已保存的所有页面重新转换、清洗整个帖子，而不是接在旧文件后面
+        """
+        converter = self.converter
+        html_files = [path for path in converter.find_html_files(self.downloader.output_dir)
+                      if converter.html_stem(path).split('_pn')[0] == post_id]
+        threads = converter.group_thread_pages(html_files)
+        if not threads or not converter.parse_html_file(threads[0][0], self.txt_writer.output_dir, threads[0][1]):
+            return False
+        
+        txt_path = self.txt_writer.output_dir / f"{post_id}.txt"
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        with open(self.cleaned_writer.output_dir / txt_path.name, 'w', encoding='utf-8') as f:
+            f.write(self.cleaner.clean_text(text, self.patterns))
+        self.txt_writer.files += 1
+        self.cleaned_writer.files += 1
+        return True
+    
+    def run(self, urls_file, **run_options):
+        """
+        下载 urls_file 中的帖子，同时转换和清洗已下载的页面
+        run_options: 传给 SimpleTiebaDownloader.run 的参数
+        """
+        self.started = time.time()
+        parsers = [threading.Thread(target=self.parse_worker, daemon=True)
+                   for _ in range(self.parse_workers)]
+        cleaners = [threading.Thread(target=self.clean_worker, daemon=True)
+                    for _ in range(self.clean_workers)]
+        for t in parsers + cleaners:
+            t.start()
+        
+        try:
+            self.downloader.run(urls_file, **run_options)
+        finally:
+            # 下载结束后等待队列中剩余的页面处理完
+            for _ in parsers:
+                self.html_queue.put(DONE)
+            for t in parsers:
+                t.join()
+            # 前面分页下载失败的页面也要清洗
+            written, missing_first = self.txt_writer.close()
+            for page in written:
+                self.text_queue.put(page)
+            for _ in cleaners:
+                self.text_queue.put(DONE)
+            for t in cleaners:
+                t.join()
+            self.cleaned_writer.close()
+            for post_id in missing_first:
+                self.rebuild_thread(post_id)
+        
+        elapsed = time.time() - self.started
+        print()
+        print("="*60)
+        print("✓ 流水线处理完成！")
+        print(f"  转换: {self.stats['parsed']} 页，跳过: {self.stats['skipped']} 页")
+        print(f"  清洗: {self.stats['cleaned']} 页，生成 {self.cleaned_writer.files} 个帖子文件")
+        if self.stats['errors']:
+            print(f"  出错: {self.stats['errors']} 页")
+        if self.first_cleaned:
+            print(f"  首个清洗结果: 开始后 {self.first_cleaned - self.started:.1f} 秒")
+        print(f"  总用时: {elapsed:.1f} 秒")
+        print(f"  TXT位置: {self.txt_writer.output_dir.absolute()}")
+        print(f"  清洗结果位置: {self.cleaned_writer.output_dir.absolute()}")
+        print("="*60)
+
+
+def main():
+    print("="*60)
+    print("贴吧帖子流水线处理（下载 → 转TXT → 清洗）")
+    print("="*60)
+    print()
+    
+    if not Path("urls.txt").exists():
+        print("❌ 找不到 urls.txt")
+        input("按回车退出...")
+        return
+    
+    # 设置参数
+    output_dir = input("HTML保存位置（直接回车: downloaded_html）: ").strip() or "downloaded_html"
+    txt_dir = input("TXT保存位置（直接回车: txt_files）: ").strip() or "txt_files"
+    cleaned_dir = input("清洗结果保存位置（直接回车: cleaned_txt）: ").strip() or "cleaned_txt"
+    delay = input("初始间隔秒数（直接回车: 3秒，运行中自动调整）: ").strip()
+    delay = float(delay) if delay else 3.0
+    print("下载方式：")
+    print("  1 = 浏览器逐页打开（默认，最稳妥）")
+    print("  2 = HTTP直连（只用浏览器登录一次，之后关闭浏览器直接下载，更快更省资源）")
+    mode = 'http' if input("请选择（直接回车: 1）: ").strip() == '2' else 'browser'
+    workers = input("下载并发数量（直接回车: 1）: ").strip()
+    workers = max(int(workers), 1) if workers else 1
+    parse_workers = input("转换线程数（直接回车: 2）: ").strip()
+    parse_workers = max(int(parse_workers), 1) if parse_workers else 2
+    queue_size = input("队列长度（最多暂存的页面数，直接回车: 16）: ").strip()
+    queue_size = max(int(queue_size), 1) if queue_size else 16
+    
+    print()
+    print(f"✓ HTML: {output_dir}/  TXT: {txt_dir}/  清洗结果: {cleaned_dir}/")
+    print(f"✓ 下载方式: {'HTTP直连' if mode == 'http' else '浏览器'}，并发 {workers}")
+    print(f"✓ 转换线程: {parse_workers}，队列长度: {queue_size}")
+    print()
+    
+    confirm = input("确认开始？(y/n): ").strip().lower()
+    if confirm != 'y':
+        print("已取消")
+        return
+    
+    print()
+    
+    pipeline = StreamPipeline(output_dir=output_dir, txt_dir=txt_dir, cleaned_dir=cleaned_dir,
+                              parse_workers=parse_workers, queue_size=queue_size)
+    pipeline.run("urls.txt", delay=delay, workers=workers, mode=mode)
+    
+    print()
+    input("按回车退出...")
+
+
+if __name__ == "__main__":
+    main()
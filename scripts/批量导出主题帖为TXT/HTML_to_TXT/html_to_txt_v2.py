@@ -11,6 +11,69 @@ import re
 from pathlib import Path
 import argparse
 import traceback
+import time
+import gzip
+import codecs
+import io
+import json
+import ast
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from html.parser import HTMLParser
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 各步骤共用的增量清单 scripts/stage_manifest.py；单独复制本脚本时没有它，每次全部转换
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+try:
+    import stage_manifest
+except ImportError:
+    stage_manifest = None
+
+# 与下载器共用的404/已删除页面判断 ../dead_page.py
+DEAD_PAGE_PATH = Path(__file__).resolve().parent.parent / "dead_page.py"
+sys.path.insert(0, str(DEAD_PAGE_PATH.parent))
+from dead_page import DELETED_MARKERS, is_dead_page, strip_non_text
+
+
+# 下载器保存的HTML文件格式（不压缩 / gz / zst）
+HTML_SUFFIXES = ('.html', '.html.gz', '.html.zst')
+# zst 文件共用的压缩字典，由下载器保存在同一目录
+ZSTD_DICT_NAME = "html.zdict"
+
+# HTML解析方式：
+#   html.parser  BeautifulSoup + Python内置解析器（最慢，无需额外安装）
+#   lxml         BeautifulSoup + lxml解析器
+#   lean         直接使用 lxml.html，不构建BeautifulSoup对象（最快）
+#   stream       标准库 html.parser 逐块读取、逐层楼写出，不构建文档树（内存占用最小）
+#   auto         已安装lxml时使用 lean，否则使用 html.parser
+PARSER_BACKENDS = ('html.parser', 'lxml', 'lean', 'stream')
+
+# 内容提取方式：
+#   floors   只提取楼层容器（l_post），每层楼输出一次；页面中没有楼层时自动改用 classes
+#   classes  旧方式：提取所有class含 content/post/reply/text 的元素（嵌套元素的文本会重复输出）
+EXTRACT_MODES = ('floors', 'classes')
+
+# 楼层容器的class
+FLOOR_CLASS = 'l_post'
+FLOOR_XPATH = f'//div[contains(concat(" ", normalize-space(@class), " "), " {FLOOR_CLASS} ")]'
+
+# 帖子内容所在元素的class
+CONTENT_CLASS_PATTERN = re.compile(r'(content|post|reply|text)')
+
+# 输出格式：
+#   txt    每个帖子一个纯文本文件
+#   jsonl  每个帖子一个 .jsonl 文件，每层楼一行JSON（楼层号、作者、时间、IP属地、正文、楼中楼回复）
+OUTPUT_FORMATS = ('txt', 'jsonl')
+
+# 楼层尾部信息
+FLOOR_NUMBER_PATTERN = re.compile(r'^(\d+)楼$')
+POST_TIME_PATTERN = re.compile(r'\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{2}')
+IP_LOCATION_PREFIX = 'IP属地:'
 
 
 def pause():
@@ -45,8 +108,15 @@ def clean_text(text):
     return text
 
 
-def extract_post_content(soup):
-    """提取帖子内容"""
+def extract_post_content(soup, include_header=True, extract='floors'):
+    """
+    提取帖子内容
+    
+    参数:
+        soup: 解析后的页面
+        include_header: 是否输出标题和描述（多页帖子的后续分页不重复输出）
+        extract: 内容提取方式，见 EXTRACT_MODES
+    """
     content_parts = []
     
     # 尝试提取帖子标题
@@ -60,9 +130,15 @@ def extract_post_content(soup):
     if meta_desc and meta_desc.get('content'):
         content_parts.append(f"描述: {clean_text(meta_desc.get('content'))}\n\n")
     
+    header_count = len(content_parts)
+    
     # 提取主要内容区域
-    # 百度贴吧的帖子内容通常在特定的div中
-    main_content = soup.find_all(['div', 'p', 'span'], class_=re.compile(r'(content|post|reply|text)'))
+    # 百度贴吧的每层楼是一个 l_post div；找不到楼层时按class关键词查找
+    main_content = None
+    if extract == 'floors':
+        main_content = soup.find_all('div', class_=FLOOR_CLASS)
+    if not main_content:
+        main_content = soup.find_all(['div', 'p', 'span'], class_=CONTENT_CLASS_PATTERN)
     
     if main_content:
         content_parts.append("主要内容:\n")
@@ -86,61 +162,804 @@ def extract_post_content(soup):
                 content_parts.append("-" * 60 + "\n")
                 content_parts.append(f"{text}\n")
     
+    if not include_header:
+        content_parts = content_parts[header_count:]
+    
     return ''.join(content_parts)
 
 
-def is_404_page(soup):
-    """检测是否为404页面"""
-    title = soup.find('title')
-    if title and '404' in title.get_text():
+def lxml_available():
+    """是否安装了lxml"""
+    try:
+        import lxml.html
         return True
+    except ImportError:
+        return False
+
+
+_parser_warnings = set()
+
+
+def resolve_parser(parser):
+    """
+    返回实际使用的解析方式
+    'auto' 按已安装的库选择；所需的库未安装时改用 html.parser
+    """
+    if parser == 'auto':
+        return 'lean' if lxml_available() else 'html.parser'
     
-    # 检查页面内容是否包含删除提示
-    text = soup.get_text()
-    if '该贴已被删除' in text or '贴子已被系统删除' in text:
-        return True
+    if parser in ('lxml', 'lean') and not lxml_available():
+        if parser not in _parser_warnings:
+            _parser_warnings.add(parser)
+            print(f"⚠️  未安装lxml，解析方式 {parser} 改用 html.parser（pip install lxml）")
+        return 'html.parser'
+    return parser
+
+
+def parse_lean(html_content):
+    """
+    用 lxml.html 解析页面，返回根元素
+    预先去掉 script/style/template 和注释，使 itertext() 的结果与 BeautifulSoup 的 get_text() 一致
+    """
+    import lxml.html
+    from lxml import etree
     
-    return False
+    root = lxml.html.document_fromstring(html_content)
+    etree.strip_elements(root, 'script', 'style', 'template', etree.Comment, etree.ProcessingInstruction,
+                         with_tail=False)
+    return root
+
+
+def lean_text(element):
+    """元素内的全部文本（相当于 BeautifulSoup 的 get_text()）"""
+    return ''.join(element.itertext())
 
 
-def parse_html_file(html_path, output_dir):
-    """解析单个HTML文件并保存为txt"""
+def extract_post_content_lean(root, include_header=True, extract='floors'):
+    """extract_post_content 的 lean 版本，输出与之完全相同"""
+    content_parts = []
+    
+    # 尝试提取帖子标题
+    title = next(root.iter('title'), None)
+    if title is not None:
+        content_parts.append(f"标题: {clean_text(lean_text(title))}\n")
+        content_parts.append("=" * 60 + "\n\n")
+    
+    # 尝试提取meta描述
+    for meta in root.iter('meta'):
+        if meta.get('name') == 'description':
+            if meta.get('content'):
+                content_parts.append(f"描述: {clean_text(meta.get('content'))}\n\n")
+            break
+    
+    header_count = len(content_parts)
+    
+    # 提取主要内容区域
+    main_content = None
+    if extract == 'floors':
+        main_content = root.xpath(FLOOR_XPATH)
+    if not main_content:
+        main_content = [element for element in root.iter('div', 'p', 'span')
+                        if CONTENT_CLASS_PATTERN.search(element.get('class') or '')]
+    
+    if main_content:
+        content_parts.append("主要内容:\n")
+        content_parts.append("-" * 60 + "\n")
+        for element in main_content:
+            text = clean_text(lean_text(element))
+            if text and len(text) > 10:  # 过滤太短的文本
+                content_parts.append(f"{text}\n\n")
+    
+    # 如果没有找到特定内容，提取body中的所有文本（script和style已在解析时去掉）
+    if len(content_parts) <= 3:
+        body = next(root.iter('body'), None)
+        if body is not None:
+            text = clean_text(lean_text(body))
+            if text:
+                content_parts.append("完整文本内容:\n")
+                content_parts.append("-" * 60 + "\n")
+                content_parts.append(f"{text}\n")
+    
+    if not include_header:
+        content_parts = content_parts[header_count:]
+    
+    return ''.join(content_parts)
+
+
+# 与 BeautifulSoup 相同，这些标签没有结束标签
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image',
+    'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source',
+    'spacer', 'track', 'wbr',
+))
+
+# 其中的文字不算作页面文本（与 get_text() 一致）
+NON_TEXT_ELEMENTS = frozenset(('script', 'style', 'template'))
+
+# 跨块查找删除提示时保留的上一段文本末尾字符数
+DELETED_MARKER_CARRY = max(len(marker) for marker in DELETED_MARKERS) - 1
+
+
+class FloorStreamParser(HTMLParser):
+    """
+    事件驱动的楼层提取（stream 方式）
+    
+    不构建文档树，边读边处理：每层楼（l_post）的结束标签一到就把它的文本写入 out，
+    内存中只保留还没读完的楼层，页面和帖子再长占用也不会增加。
+    输出与 extract_post_content(extract='floors') 相同；
+    页面中没有楼层等不适合逐层写出的情况由 complete() 报告，调用方改用完整解析。
+    """
+    
+    def __init__(self, out, include_header=True):
+        super().__init__(convert_charrefs=True)
+        self.out = out
+        self.include_header = include_header
+        # 尚未关闭的标签，与 BeautifulSoup 一样，结束标签关闭最近的同名标签
+        self.stack = []
+        self.non_text_depth = 0
+        # 标题和描述：楼层开始之前在 <head> 中读到
+        self.title_parts = None
+        self.title_index = None
+        self.title = None
+        self.description = None
+        self.description_found = False
+        # 第一层楼之后才出现标题或描述，无法再放到开头
+        self.late_header = False
+        # 按开始顺序排列的楼层 [在 stack 中的位置, 文本片段, 是否已结束]；楼中楼的嵌套楼层同样处理
+        self.floors = []
+        self.floor_count = 0
+        self.emitted = 0
+        self.written = 0
+        self.dead = False
+        self.carry = ''
+    
+    def write(self, text):
+        self.out.write(text)
+        self.written += len(text)
+    
+    def header_parts(self):
+        parts = []
+        if self.title is not None:
+            parts.append(f"标题: {clean_text(self.title)}\n")
+            parts.append("=" * 60 + "\n\n")
+        if self.description:
+            parts.append(f"描述: {clean_text(self.description)}\n\n")
+        return parts
+    
+    def feed(self, data):
+        if not self.dead:
+            super().feed(data)
+    
+    def handle_starttag(self, tag, attrs):
+        if self.dead:
+            return
+        if tag == 'meta':
+            attributes = dict(attrs)
+            if not self.description_found and attributes.get('name') == 'description':
+                self.description_found = True
+                self.description = attributes.get('content')
+                if self.floor_count:
+                    self.late_header = True
+        if tag in VOID_ELEMENTS:
+            return
+        
+        index = len(self.stack)
+        self.stack.append(tag)
+        if tag in NON_TEXT_ELEMENTS:
+            self.non_text_depth += 1
+        elif tag == 'title' and self.title is None and self.title_parts is None:
+            self.title_parts = []
+            self.title_index = index
+            if self.floor_count:
+                self.late_header = True
+        elif tag == 'div' and FLOOR_CLASS in (dict(attrs).get('class') or '').split():
+            if not self.floor_count:
+                if self.title_parts is not None:
+                    self.late_header = True
+                parts = self.header_parts() if self.include_header else []
+                parts.append("主要内容:\n")
+                parts.append("-" * 60 + "\n")
+                self.write(''.join(parts))
+            self.floor_count += 1
+            self.floors.append([index, [], False])
+    
+    def handle_endtag(self, tag):
+        if self.dead or tag not in self.stack:
+            return
+        index = len(self.stack) - 1 - self.stack[::-1].index(tag)
+        for closed in self.stack[index:]:
+            if closed in NON_TEXT_ELEMENTS:
+                self.non_text_depth -= 1
+        del self.stack[index:]
+        
+        if self.title_parts is not None and self.title_index >= index:
+            self.title = ''.join(self.title_parts)
+            self.title_parts = None
+            if '404' in self.title:
+                self.dead = True
+                return
+        
+        closed_floor = False
+        for floor in self.floors:
+            if not floor[2] and floor[0] >= index:
+                floor[2] = True
+                closed_floor = True
+        if closed_floor:
+            self.flush_floors()
+    
+    def flush_floors(self):
+        """按开始顺序写出已经结束的楼层（外层楼层要等它结束后，才轮到其中嵌套的楼层）"""
+        while self.floors and self.floors[0][2]:
+            _, parts, _ = self.floors.pop(0)
+            text = clean_text(''.join(parts))
+            if text and len(text) > 10:  # 过滤太短的文本
+                self.write(f"{text}\n\n")
+                self.emitted += 1
+    
+    def handle_data(self, data):
+        if self.dead or self.non_text_depth:
+            return
+        # 删除提示只在页面文本中查找（与 is_dead_page 相同，脚本中的文字不算）
+        # 提示可能被分在两块中，带上上一段文本的末尾一起查找
+        window = self.carry + data
+        if any(marker in window for marker in DELETED_MARKERS):
+            self.dead = True
+            return
+        self.carry = window[-DELETED_MARKER_CARRY:]
+        if self.title_parts is not None:
+            self.title_parts.append(data)
+        for floor in self.floors:
+            if not floor[2]:
+                floor[1].append(data)
+    
+    def close(self):
+        if not self.dead:
+            super().close()
+            # 文件结束时仍未关闭的楼层也输出
+            for floor in self.floors:
+                floor[2] = True
+            self.flush_floors()
+            if self.title_parts is not None:
+                self.title = ''.join(self.title_parts)
+                self.title_parts = None
+                self.late_header = True
+    
+    def complete(self):
+        """
+        是否成功逐层写出
+        没有楼层、标题/描述出现在楼层之后、或内容少到 extract_post_content 会改输出整页文本时返回 False
+        """
+        if not self.floor_count or self.late_header:
+            return False
+        header_count = (2 if self.title is not None else 0) + (1 if self.description else 0)
+        return header_count + 2 + self.emitted > 3
+
+
+def stream_floors(chunks, out, include_header=True):
+    """
+    把依次读到的HTML文本块交给 FloorStreamParser，楼层文本直接写入 out
+    
+    返回: (结果, 写入的字符数)
+        结果为 True 表示完成；None 表示404或已删除的页面；
+        False 表示页面不适合逐层写出，需要改用完整解析（out 中已写入的内容由调用方删除）
+    """
+    extractor = FloorStreamParser(out, include_header)
+    for chunk in chunks:
+        extractor.feed(chunk)
+        if extractor.dead:
+            return None, 0
+    extractor.close()
+    if extractor.dead:
+        return None, 0
+    return extractor.complete(), extractor.written
+
+
+def html_stem(html_path):
+    """去掉 .html / .html.gz / .html.zst 扩展名后的文件名"""
+    name = html_path.name
+    for suffix in HTML_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return html_path.stem
+
+
+_zstd_decompressors = {}
+
+
+def zstd_decompressor(directory):
+    """读取目录中的压缩字典，返回对应的zst解压器"""
+    if zstandard is None:
+        raise RuntimeError("读取 .html.zst 需要安装 zstandard（pip install zstandard）")
+    
+    if directory not in _zstd_decompressors:
+        dict_file = directory / ZSTD_DICT_NAME
+        if not dict_file.exists():
+            raise RuntimeError(f"找不到压缩字典 {dict_file}")
+        with open(dict_file, 'rb') as f:
+            dict_data = zstandard.ZstdCompressionDict(f.read(), dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        _zstd_decompressors[directory] = zstandard.ZstdDecompressor(dict_data=dict_data)
+    return _zstd_decompressors[directory]
+
+
+def open_html_stream(html_path):
+    """以二进制流打开HTML文件，.html.gz / .html.zst 边读边解压"""
+    if html_path.name.endswith('.gz'):
+        return gzip.open(html_path, 'rb')
+    if html_path.name.endswith('.zst'):
+        return zstd_decompressor(html_path.parent).stream_reader(open(html_path, 'rb'))
+    return open(html_path, 'rb')
+
+
+def read_html_bytes(html_path):
+    """读取HTML文件的原始字节，.html.gz / .html.zst 自动解压"""
+    with open(html_path, 'rb') as f:
+        data = f.read()
+    
+    if html_path.name.endswith('.gz'):
+        return gzip.decompress(data)
+    if html_path.name.endswith('.zst'):
+        return zstd_decompressor(html_path.parent).decompress(data)
+    return data
+
+
+# 文件开头的BOM
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# <meta charset="..."> 或 <meta http-equiv="Content-Type" content="text/html; charset=...">
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]*?charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+
+# 在页面开头多少字节内查找 meta charset
+META_CHARSET_SCAN_BYTES = 4096
+
+
+def declared_encoding(data):
+    """页面开头声明的编码；GBK/GB2312统一按其超集GB18030处理"""
+    match = META_CHARSET_PATTERN.search(data[:META_CHARSET_SCAN_BYTES])
+    if not match:
+        return None
     try:
-        from bs4 import BeautifulSoup
+        name = codecs.lookup(match.group(1).decode('ascii')).name
+    except LookupError:
+        return None
+    return 'gb18030' if name in ('gbk', 'gb2312') else name
+
+
+def bom_encoding(data):
+    """文件开头BOM对应的编码，没有BOM时返回 None"""
+    for bom, encoding in BOM_ENCODINGS:
+        if data.startswith(bom):
+            return encoding
+    return None
+
+
+def encoding_candidates(data):
+    """依次尝试的编码：页面声明的编码 → UTF-8 → GB18030（data 只需包含页面开头）"""
+    candidates = []
+    for encoding in (declared_encoding(data), 'utf-8', 'gb18030'):
+        if encoding and encoding not in candidates:
+            candidates.append(encoding)
+    return candidates
+
+
+def decode_html(data):
+    """
+    检测编码并解码HTML字节
+    
+    依次使用：BOM → 页面声明的编码 → UTF-8 → GB18030，
+    按顺序严格解码，第一个成功的就是实际编码（通常只需解码一次）
+    返回: (文本, 编码名称)
+    """
+    encoding = bom_encoding(data)
+    if encoding:
+        return data.decode(encoding, errors='replace'), encoding
+    
+    candidates = encoding_candidates(data)
+    for encoding in candidates:
+        try:
+            return data.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    
+    # 都无法完整解码时，按首选编码解码并替换错误字节
+    return data.decode(candidates[0], errors='replace'), candidates[0] + '(有错误字节)'
+
+
+def read_html(html_path):
+    """
+    读取HTML文件内容（只读一次文件、只解码一次）
+    返回: (文本, 检测到的编码)；404或已删除的页面在解码之前就能判断，返回 (None, None)
+    """
+    data = read_html_bytes(html_path)
+    if is_dead_page(data):
+        return None, None
+    return decode_html(data)
+
+
+# stream 方式每次读取的字节数
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def read_html_head(html_path):
+    """读取页面开头用于检测编码的部分"""
+    head = b''
+    with open_html_stream(html_path) as f:
+        while len(head) < META_CHARSET_SCAN_BYTES:
+            block = f.read(META_CHARSET_SCAN_BYTES - len(head))
+            if not block:
+                break
+            head += block
+    return head
+
+
+def read_html_chunks(html_path, encoding, errors='strict'):
+    """逐块读取并解码HTML文件；errors='strict' 时遇到无法解码的字节抛出 UnicodeDecodeError"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    with open_html_stream(html_path) as f:
+        for block in iter(lambda: f.read(STREAM_CHUNK_BYTES), b''):
+            yield decoder.decode(block)
+    yield decoder.decode(b'', final=True)
+
+
+def stream_html_page(html_path, out, include_header=True):
+    """
+    流式转换一页HTML，楼层文本直接写入 out（需支持 tell/seek/truncate）
+    
+    编码的检测顺序与 decode_html 相同：当前编码在中途解码失败时，
+    删除这一页已写入的内容，换下一个编码重新读取
+    返回: (编码名称, 写入的字符数)；404或已删除的页面返回 (None, 0)，不写入任何内容
+    """
+    start = out.tell()
+    head = read_html_head(html_path)
+    encoding = bom_encoding(head)
+    if encoding:
+        attempts = [(encoding, 'replace', encoding)]
+    else:
+        candidates = encoding_candidates(head)
+        attempts = [(encoding, 'strict', encoding) for encoding in candidates]
+        attempts.append((candidates[0], 'replace', candidates[0] + '(有错误字节)'))
+    
+    for encoding, errors, label in attempts:
+        out.seek(start)
+        out.truncate()
+        try:
+            result, written = stream_floors(read_html_chunks(html_path, encoding, errors), out, include_header)
+            if result is False:
+                # 没有楼层等情况：这一页改用完整解析
+                out.seek(start)
+                out.truncate()
+                html_content = read_html_bytes(html_path).decode(encoding, errors)
+                text = convert_html(html_content, include_header, parser='html.parser', extract='floors')
+                if text is not None:
+                    out.write(text)
+                    written = len(text)
+                else:
+                    result = None
+        except UnicodeDecodeError:
+            continue
         
-        # 读取HTML文件
-        with open(html_path, 'r', encoding='utf-8', errors='ignore') as f:
-            html_content = f.read()
+        if result is None:
+            out.seek(start)
+            out.truncate()
+            return None, 0
+        return label, written
+
+
+def stream_html_file(html_path, output_dir, extra_pages=()):
+    """
+    parse_html_file 的 stream 方式：边读边解析，每层楼读完就写入输出文件
+    内存占用只与单层楼的长度有关，与页面大小和分页数量无关；返回值与 parse_html_file 相同
+    """
+    output_filename = html_stem(html_path) + '.txt'
+    output_path = output_dir / output_filename
+    # 先写到临时文件，完成后再改名，跳过或出错时不留下不完整的txt
+    temp_path = output_dir / (output_filename + '.part')
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as out:
+            encoding, written = stream_html_page(html_path, out)
+            
+            # 检查是否为404页面
+            if encoding is None:
+                print(f"⚠️  跳过404页面: {html_path.name}")
+                return False
+            
+            if written < 50:
+                print(f"⚠️  内容过短，跳过: {html_path.name} [{encoding}]")
+                return False
+            
+            # 合并后续分页
+            encodings = [encoding]
+            for page_path in extra_pages:
+                start = out.tell()
+                out.write(page_separator(html_stem(page_path).rsplit('_pn', 1)[-1]))
+                encoding, _ = stream_html_page(page_path, out, include_header=False)
+                if encoding is None:
+                    out.seek(start)
+                    out.truncate()
+                    continue
+                encodings.append(encoding)
+        
+        os.replace(temp_path, output_path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    
+    pages_note = f" (+{len(extra_pages)}页)" if extra_pages else ""
+    print(f"✓ 成功转换: {html_path.name}{pages_note} -> {output_filename} [{encoding_note(encodings)}]")
+    return True
+
+
+def parse_data_field(element):
+    """
+    读取元素的 data-field 属性
+    楼层使用JSON，楼中楼使用单引号的写法，都无法解析时返回空字典
+    """
+    raw = element.get('data-field')
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        try:
+            data = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            return {}
+    return data if isinstance(data, dict) else {}
+
+
+def extract_floor_reply(item):
+    """提取一条楼中楼回复"""
+    data = parse_data_field(item)
+    author = data.get('user_name')
+    if not author:
+        link = item.find('a', class_='at')
+        author = clean_text(link.get_text()) if link else None
+    content = item.find(class_='lzl_content_main')
+    reply_time = item.find(class_='lzl_time')
+    return {
+        'author': author,
+        'nickname': data.get('user_nickname'),
+        'time': clean_text(reply_time.get_text()) if reply_time else None,
+        'content': clean_text(content.get_text()) if content else '',
+    }
+
+
+def extract_floor_records(soup, thread_id, page=1):
+    """
+    把每层楼提取为一条记录
+    
+    参数:
+        soup: 解析后的页面
+        thread_id: 帖子ID（页面中没有时使用）
+        page: 页码
+    返回:
+        记录列表，按楼层顺序
+    """
+    title = soup.find('title')
+    title = clean_text(title.get_text()) if title else ''
+    
+    records = []
+    for floor in soup.find_all('div', class_=FLOOR_CLASS):
+        data = parse_data_field(floor)
+        author = data.get('author') or {}
+        post = data.get('content') or {}
+        
+        # 尾部：IP属地、来自客户端、N楼、发帖时间
+        ip_location = None
+        floor_number = post.get('post_no')
+        post_time = None
+        tail = floor.find(class_='post-tail-wrap') or floor.find(class_='core_reply_tail')
+        if tail:
+            for span in tail.find_all('span'):
+                text = clean_text(span.get_text())
+                if text.startswith(IP_LOCATION_PREFIX):
+                    ip_location = text[len(IP_LOCATION_PREFIX):].strip() or None
+                elif FLOOR_NUMBER_PATTERN.match(text):
+                    floor_number = floor_number or int(FLOOR_NUMBER_PATTERN.match(text).group(1))
+                elif POST_TIME_PATTERN.fullmatch(text):
+                    post_time = text
+        
+        author_name = author.get('user_name')
+        if not author_name:
+            name_link = floor.find(class_='p_author_name')
+            author_name = clean_text(name_link.get_text()) if name_link else None
+        
+        content = floor.find(class_='d_post_content')
+        records.append({
+            'thread_id': str(post.get('thread_id') or thread_id),
+            'title': title,
+            'page': page,
+            'floor': floor_number,
+            'post_id': post.get('post_id') or floor.get('data-pid'),
+            'author': author_name,
+            'nickname': author.get('user_nickname'),
+            'time': post_time,
+            'ip': ip_location,
+            'content': clean_text(content.get_text()) if content else '',
+            'replies': [extract_floor_reply(item)
+                        for item in floor.find_all('li', class_='lzl_single_post')],
+        })
+    
+    return records
+
+
+def convert_html_records(html_content, thread_id, page=1, parser='auto'):
+    """
+    把一页HTML转换为楼层记录
+    返回: 记录列表；404页面返回 None
+    """
+    from bs4 import BeautifulSoup
+    
+    # 楼层记录需要BeautifulSoup的查找功能，lean 方式改用 BeautifulSoup + lxml，stream 方式改用 html.parser
+    # 解析之前先排除404页面
+    if is_dead_page(html_content):
+        return None
+    
+    resolved = resolve_parser(parser)
+    parser = {'lean': 'lxml', 'stream': 'html.parser'}.get(resolved, resolved)
+    soup = BeautifulSoup(strip_non_text(html_content), parser)
+    return extract_floor_records(soup, thread_id, page)
+
+
+def encoding_note(encodings):
+    """各页编码的说明，例如 'utf-8' 或 'utf-8/gb18030'"""
+    return '/'.join(dict.fromkeys(encoding for encoding in encodings if encoding))
+
+
+def save_floor_records(html_path, output_dir, extra_pages=(), parser='auto'):
+    """
+    把一个帖子（含后续分页）的所有楼层保存为 <帖子ID>.jsonl，每层楼一行
+    返回值与 parse_html_file 相同
+    """
+    thread_id = html_stem(html_path)
+    html_content, encoding = read_html(html_path)
+    encodings = [encoding]
+    records = None if html_content is None else convert_html_records(html_content, thread_id, parser=parser)
+    
+    if records is None:
+        print(f"⚠️  跳过404页面: {html_path.name}")
+        return False
+    
+    if not records:
+        print(f"⚠️  未找到楼层，跳过: {html_path.name}")
+        return False
+    
+    for page_path in extra_pages:
+        page = int(html_stem(page_path).rsplit('_pn', 1)[-1])
+        html_content, encoding = read_html(page_path)
+        if html_content is None:
+            continue
+        encodings.append(encoding)
+        records.extend(convert_html_records(html_content, thread_id, page, parser) or [])
+    
+    output_filename = thread_id + '.jsonl'
+    with open(output_dir / output_filename, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    
+    pages_note = f" (+{len(extra_pages)}页)" if extra_pages else ""
+    print(f"✓ 成功转换: {html_path.name}{pages_note} -> {output_filename}（{len(records)} 层）"
+          f" [{encoding_note(encodings)}]")
+    return True
+
+
+def convert_html(html_content, include_header=True, parser='auto', extract='floors', prestrip=None):
+    """
+    把一页HTML内容转换为文本
+    
+    参数:
+        html_content: HTML字符串
+        include_header: 是否输出标题和描述
+        parser: 解析方式，见 PARSER_BACKENDS
+        extract: 内容提取方式，见 EXTRACT_MODES
+        prestrip: 解析前先删除 script/style 块和注释（结果相同）；
+                  None 表示只对BeautifulSoup的两种方式预过滤，lean/stream 跳过脚本本来就很快，预过滤反而多花时间
+    返回:
+        文本内容；404页面返回 None
+    """
+    # 检查是否为404页面（在解析之前，已删除的帖子不必解析）
+    if is_dead_page(html_content):
+        return None
+    
+    parser = resolve_parser(parser)
+    
+    if prestrip is None:
+        prestrip = parser in ('html.parser', 'lxml')
+    if prestrip:
+        html_content = strip_non_text(html_content)
+    
+    if parser == 'stream':
+        if extract == 'floors':
+            out = io.StringIO()
+            result, _ = stream_floors([html_content], out, include_header)
+            if result is None:
+                return None
+            if result:
+                return out.getvalue()
+        # classes 方式和没有楼层的页面需要完整的文档树
+        parser = 'html.parser'
+    
+    if parser == 'lean':
+        from lxml import etree
+        try:
+            root = parse_lean(html_content)
+        except etree.ParserError:
+            # 空白页面
+            return ''
+        return extract_post_content_lean(root, include_header, extract)
+    
+    from bs4 import BeautifulSoup
+    
+    # 解析HTML
+    soup = BeautifulSoup(html_content, parser)
+    
+    # 提取内容
+    return extract_post_content(soup, include_header, extract)
+
+
+def page_separator(page_number):
+    """多页帖子中每个后续分页前的分隔行"""
+    return f"\n第{page_number}页:\n" + "=" * 60 + "\n\n"
+
+
+def parse_html_file(html_path, output_dir, extra_pages=(), parser='auto', extract='floors',
+                    output_format='txt'):
+    """
+    解析单个HTML文件并保存为txt
+    
+    参数:
+        html_path: 帖子首页HTML文件
+        output_dir: 输出目录
+        extra_pages: 同一帖子后续分页的HTML文件（按页码排序），内容按顺序合并到同一个txt
+        parser: 解析方式，见 PARSER_BACKENDS
+        extract: 内容提取方式，见 EXTRACT_MODES（仅txt格式）
+        output_format: 输出格式，见 OUTPUT_FORMATS
+    """
+    try:
+        if output_format == 'jsonl':
+            return save_floor_records(html_path, output_dir, extra_pages, parser)
         
-        # 如果UTF-8失败，尝试GBK编码（百度贴吧可能使用GBK）
-        if not html_content or len(html_content) < 100:
-            with open(html_path, 'r', encoding='gbk', errors='ignore') as f:
-                html_content = f.read()
+        if parser == 'stream' and extract == 'floors':
+            return stream_html_file(html_path, output_dir, extra_pages)
         
-        # 解析HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # 读取并转换HTML
+        html_content, encoding = read_html(html_path)
+        encodings = [encoding]
+        content = None if html_content is None else convert_html(html_content, parser=parser, extract=extract)
         
         # 检查是否为404页面
-        if is_404_page(soup):
+        if content is None:
             print(f"⚠️  跳过404页面: {html_path.name}")
             return False
         
-        # 提取内容
-        content = extract_post_content(soup)
-        
         if not content or len(content) < 50:
-            print(f"⚠️  内容过短，跳过: {html_path.name}")
+            print(f"⚠️  内容过短，跳过: {html_path.name} [{encoding}]")
             return False
         
+        # 合并后续分页
+        for page_path in extra_pages:
+            html_content, encoding = read_html(page_path)
+            if html_content is None:
+                continue
+            encodings.append(encoding)
+            page_content = convert_html(html_content, include_header=False, parser=parser, extract=extract)
+            if page_content is None:
+                continue
+            content += page_separator(html_stem(page_path).rsplit('_pn', 1)[-1]) + page_content
+        
         # 生成输出文件名
-        output_filename = html_path.stem + '.txt'
+        output_filename = html_stem(html_path) + '.txt'
         output_path = output_dir / output_filename
         
         # 保存为txt文件
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write(content)
         
-        print(f"✓ 成功转换: {html_path.name} -> {output_filename}")
+        pages_note = f" (+{len(extra_pages)}页)" if extra_pages else ""
+        print(f"✓ 成功转换: {html_path.name}{pages_note} -> {output_filename} [{encoding_note(encodings)}]")
         return True
         
     except Exception as e:
@@ -148,8 +967,77 @@ def parse_html_file(html_path, output_dir):
         return None
 
 
-def batch_convert(input_dir, output_dir):
-    """批量转换HTML文件"""
+# 下载器把多页帖子的第k页保存为 <id>_pn<k>.html
+PAGE_FILE_PATTERN = re.compile(r'^(.+)_pn(\d+)$')
+
+
+def find_html_files(input_path):
+    """
+    查找目录中的HTML文件（包括压缩保存的）
+    同一页面有多种格式时只取一个（优先未压缩的）
+    """
+    html_files = {}
+    for suffix in HTML_SUFFIXES:
+        for html_file in sorted(input_path.glob('*' + suffix)):
+            html_files.setdefault(html_stem(html_file), html_file)
+    return list(html_files.values())
+
+
+def group_thread_pages(html_files):
+    """
+    把分页文件归到各自帖子的首页下
+    
+    返回: [(首页文件, [按页码排序的后续分页文件]), ...]
+    没有首页的分页会被忽略
+    """
+    pages = {}
+    first_pages = []
+    for html_file in html_files:
+        match = PAGE_FILE_PATTERN.match(html_stem(html_file))
+        if match:
+            pages.setdefault(match.group(1), []).append((int(match.group(2)), html_file))
+        else:
+            first_pages.append(html_file)
+    
+    threads = []
+    for html_file in first_pages:
+        extra = sorted(pages.pop(html_stem(html_file), []))
+        threads.append((html_file, [path for _, path in extra]))
+    
+    for stem in pages:
+        print(f"⚠️  找不到 {stem}.html，忽略其分页文件")
+    
+    return threads
+
+
+def convert_thread(task):
+    """
+    进程池任务：转换一个帖子
+    
+    返回: (parse_html_file 的结果, 转换过程中输出的信息)
+    输出先暂存，由主进程按顺序打印，避免多个进程的输出混在一起
+    """
+    html_file, output_path, extra_pages, options = task
+    buffer = io.StringIO()
+    with redirect_stdout(buffer):
+        result = parse_html_file(html_file, output_path, extra_pages, **options)
+    return result, buffer.getvalue()
+
+
+def batch_convert(input_dir, output_dir, workers=1, parser='auto', extract='floors', output_format='txt',
+                  force=False):
+    """
+    批量转换HTML文件
+    
+    参数:
+        input_dir: 输入目录
+        output_dir: 输出目录
+        workers: 并行进程数，1 表示在当前进程中逐个转换
+        parser: 解析方式，见 PARSER_BACKENDS
+        extract: 内容提取方式，见 EXTRACT_MODES
+        output_format: 输出格式，见 OUTPUT_FORMATS
+        force: True 时忽略输出目录中的清单，全部重新转换
+    """
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     
@@ -162,31 +1050,75 @@ def batch_convert(input_dir, output_dir):
     output_path.mkdir(parents=True, exist_ok=True)
     
     # 获取所有HTML文件
-    html_files = list(input_path.glob('*.html'))
+    html_files = find_html_files(input_path)
     
     if not html_files:
         print(f"错误: 在 {input_dir} 中没有找到HTML文件")
         return
     
-    print(f"\n找到 {len(html_files)} 个HTML文件")
+    # 多页帖子的分页合并到首页一起转换
+    threads = group_thread_pages(html_files)
+    
+    print(f"\n找到 {len(html_files)} 个HTML文件（{len(threads)} 个帖子）")
     print(f"输入目录: {input_path.absolute()}")
-    print(f"输出目录: {output_path.absolute()}\n")
+    print(f"输出目录: {output_path.absolute()}")
+    parser = resolve_parser(parser)
+    if output_format == 'jsonl':
+        print(f"解析方式: {parser}，输出格式: 每层楼一行JSON\n")
+    else:
+        print(f"解析方式: {parser}，提取方式: {extract}\n")
     print("=" * 60)
     
     success_count = 0
     skip_count = 0
     error_count = 0
     
-    for i, html_file in enumerate(html_files, 1):
-        print(f"[{i}/{len(html_files)}] ", end='')
-        result = parse_html_file(html_file, output_path)
-        
-        if result:
-            success_count += 1
-        elif result is False:
-            skip_count += 1
-        else:
-            error_count += 1
+    options = {'parser': parser, 'extract': extract, 'output_format': output_format}
+    
+    # 跳过上次已转换、之后没有变化的帖子（首页和各分页的内容、参数、脚本都相同）
+    manifest = None
+    if stage_manifest:
+        # dead_page.py 改变时（如删除提示），所有页面都要重新判断
+        manifest = stage_manifest.for_script(output_path, __file__, options, force,
+                                             extra_sources=[DEAD_PAGE_PATH])
+        threads = [(html_file, extra_pages) for html_file, extra_pages in threads
+                   if not manifest.is_current(html_stem(html_file), [html_file, *extra_pages])]
+        if manifest.summary():
+            print(manifest.summary())
+            print("=" * 60)
+    
+    if workers > 1:
+        # 分批提交给进程池，结果按原顺序返回
+        tasks = [(html_file, output_path, extra_pages, options) for html_file, extra_pages in threads]
+        chunksize = max(1, len(tasks) // (workers * 4))
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(convert_thread, tasks, chunksize=chunksize)
+    else:
+        pool = None
+        results = (convert_thread((html_file, output_path, extra_pages, options))
+                   for html_file, extra_pages in threads)
+    
+    output_suffix = '.jsonl' if output_format == 'jsonl' else '.txt'
+    try:
+        for i, ((html_file, _), (result, output)) in enumerate(zip(threads, results), 1):
+            print(f"[{i}/{len(threads)}] {output}", end='')
+            
+            if result:
+                success_count += 1
+            elif result is False:
+                skip_count += 1
+            else:
+                error_count += 1
+            
+            # 转换失败的不记录，下次重试；跳过的404页面记录为没有输出
+            if manifest and result is not None:
+                stem = html_stem(html_file)
+                manifest.record(stem, output_path / (stem + output_suffix) if result else None)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if manifest:
+            manifest.save()
     
     # 输出统计信息
     print("\n" + "=" * 60)
@@ -194,9 +1126,61 @@ def batch_convert(input_dir, output_dir):
     print(f"  ✓ 成功: {success_count} 个文件")
     print(f"  ⚠ 跳过: {skip_count} 个文件 (404页面或内容过短)")
     print(f"  ✗ 失败: {error_count} 个文件")
+    if manifest and manifest.skipped:
+        print(f"  = 未变化: {manifest.skipped} 个帖子（沿用上次的结果）")
     print(f"\n输出目录: {output_path.absolute()}\n")
 
 
+def benchmark_parsers(input_dir, extract='floors'):
+    """
+    用各解析方式转换目录中的所有HTML文件，比较耗时，
+    并确认结果与 html.parser 完全相同
+    """
+    input_path = Path(input_dir)
+    html_files = find_html_files(input_path)
+    if not html_files:
+        print(f"错误: 在 {input_dir} 中没有找到HTML文件")
+        return
+    
+    backends = ['html.parser'] + [p for p in PARSER_BACKENDS[1:] if resolve_parser(p) == p]
+    pages = [read_html(html_file)[0] for html_file in html_files]
+    # 404页面在读取时就已排除，不参与比较
+    html_files = [html_file for html_file, page in zip(html_files, pages) if page is not None]
+    pages = [page for page in pages if page is not None]
+    print(f"\n测试 {len(pages)} 个HTML文件，解析方式: {', '.join(backends)}")
+    
+    # 预过滤本身的耗时和删掉的比例
+    start = time.perf_counter()
+    stripped = [strip_non_text(page) for page in pages]
+    strip_time = time.perf_counter() - start
+    before = sum(len(page) for page in pages)
+    after = sum(len(page) for page in stripped)
+    print(f"预过滤（删除script/style/注释）: {before:,} -> {after:,} 字符（删除 {1 - after / before:.0%}），"
+          f"耗时 {strip_time:.2f}s\n")
+    
+    # 每种方式分别测试不预过滤和预过滤（+strip，耗时包含预过滤本身）
+    results = {}
+    timings = {}
+    for backend in backends:
+        for prestrip in (False, True):
+            name = backend + ('+strip' if prestrip else '')
+            start = time.perf_counter()
+            results[name] = [convert_html(page, parser=backend, extract=extract, prestrip=prestrip)
+                             for page in pages]
+            timings[name] = time.perf_counter() - start
+    
+    baseline = results['html.parser']
+    print(f"{'解析方式':<18}{'耗时':>10}{'加速':>8}  结果")
+    for name in results:
+        different = [html_files[i].name for i, text in enumerate(results[name]) if text != baseline[i]]
+        status = "与 html.parser 相同" if not different else f"{len(different)} 个文件不同: {', '.join(different[:5])}"
+        print(f"{name:<18}{timings[name]:>9.2f}s{timings['html.parser'] / timings[name]:>7.1f}x  {status}")
+    
+    missing = [p for p in PARSER_BACKENDS if p not in backends]
+    if missing:
+        print(f"\n未测试（缺少lxml）: {', '.join(missing)}")
+
+
 def get_script_directory():
     """获取脚本所在目录"""
     if getattr(sys, 'frozen', False):
@@ -248,8 +1232,14 @@ def main():
             if not output_dir:
                 output_dir = default_output
             
+            # 询问并行进程数
+            print(f"\n请输入并行进程数（本机共 {os.cpu_count()} 核）:")
+            print("(直接按回车: 1，逐个转换)")
+            workers = input("> ").strip()
+            workers = max(int(workers), 1) if workers else 1
+            
             print("\n开始转换...\n")
-            batch_convert(str(input_path), str(output_dir))
+            batch_convert(str(input_path), str(output_dir), workers)
             
         else:
             # 命令行模式
@@ -278,8 +1268,52 @@ def main():
                 help='输出目录路径 (默认: 脚本所在目录/txt_files)'
             )
             
+            parser.add_argument(
+                '-w', '--workers',
+                type=int,
+                default=1,
+                help='并行进程数 (默认: 1，逐个转换)'
+            )
+            
+            parser.add_argument(
+                '-p', '--parser',
+                choices=('auto',) + PARSER_BACKENDS,
+                default='auto',
+                help='HTML解析方式 (默认: auto，已安装lxml时使用最快的lean)'
+            )
+            
+            parser.add_argument(
+                '-x', '--extract',
+                choices=EXTRACT_MODES,
+                default='floors',
+                help='内容提取方式 (默认: floors，每层楼输出一次；classes 为旧方式)'
+            )
+            
+            parser.add_argument(
+                '-f', '--format',
+                choices=OUTPUT_FORMATS,
+                default='txt',
+                help='输出格式 (默认: txt；jsonl 为每层楼一行JSON)'
+            )
+            
+            parser.add_argument(
+                '--force',
+                action='store_true',
+                help='忽略上次的转换记录，全部重新转换'
+            )
+            
+            parser.add_argument(
+                '--benchmark',
+                action='store_true',
+                help='比较各解析方式的速度并检查结果是否一致，不输出文件'
+            )
+            
             args = parser.parse_args()
-            batch_convert(args.input, args.output)
+            if args.benchmark:
+                benchmark_parsers(args.input, args.extract)
+            else:
+                batch_convert(args.input, args.output, max(args.workers, 1), args.parser, args.extract, args.format,
+                              args.force)
         
         pause()
         
@@ -300,4 +1334,6 @@ def main():
 
 
 if __name__ == '__main__':
+    # 打包成exe后使用进程池需要
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+判断404或已删除的贴吧页面
+下载器（HTML_Download/download_html_simple.py）和转换器（HTML_to_TXT/html_to_txt_v2.py）共用，
+两边对同一个页面的判断总是相同。
+"""
+
+import re
+
+
+# 帖子被删除后页面中的提示
+DELETED_MARKERS = ('该贴已被删除', '贴子已被系统删除')
+DELETED_MARKER_BYTES = tuple(marker.encode(encoding)
+                             for marker in DELETED_MARKERS for encoding in ('utf-8', 'gb18030'))
+TITLE_PATTERN = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+TITLE_BYTES_PATTERN = re.compile(rb'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+# 注释、<script>、<style>：其中的文字不是页面文本
+# 贴吧页面约一半是内嵌脚本和配置JSON，正常帖子的脚本中也可能出现删除提示
+NON_TEXT_BLOCK_PATTERN = re.compile(r'<!--.*?-->|<(script|style)\b[^>]*>.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+NON_TEXT_BLOCK_BYTES_PATTERN = re.compile(rb'<!--.*?-->|<(script|style)\b[^>]*>.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+
+
+def strip_non_text(html):
+    """
+    删除注释和 script/style 块（不解析页面，只做一次正则替换）
+    html 可以是文本，也可以是UTF-8/GBK等兼容ASCII编码的原始字节
+    """
+    if isinstance(html, bytes):
+        return NON_TEXT_BLOCK_BYTES_PATTERN.sub(b'', html)
+    return NON_TEXT_BLOCK_PATTERN.sub('', html)
+
+
+def is_dead_page(html):
+    """
+    检测是否为404或已删除的页面
+    只查找<title>和页面文本中的删除提示，不解析页面；html 可以是文本，也可以是文件的原始字节
+    """
+    if isinstance(html, bytes):
+        title_pattern, markers, code = TITLE_BYTES_PATTERN, DELETED_MARKER_BYTES, b'404'
+    else:
+        title_pattern, markers, code = TITLE_PATTERN, DELETED_MARKERS, '404'
+
+    title = title_pattern.search(html)
+    if title and code in title.group(1):
+        return True
+
+    # 绝大多数页面没有删除提示，直接返回；找到时再确认它不只出现在脚本或注释中
+    if not any(marker in html for marker in markers):
+        return False
+    text = strip_non_text(html)
+    return any(marker in text for marker in markers)
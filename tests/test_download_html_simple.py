@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+下载脚本 download_html_simple.py 中纯HTTP下载器 HttpFetcher 的测试
+在本机启动一个 HTTP/1.1 服务器，检查 keep-alive 连接的复用和重连
+运行: python -m pytest
+"""
+
+import queue
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("selenium")
+
+ROOT = Path(__file__).resolve().parent.parent
+DOWNLOAD_DIR = ROOT / "scripts" / "批量导出主题帖为TXT" / "HTML_Download"
+
+sys.path.insert(0, str(DOWNLOAD_DIR))
+from download_html_simple import HttpFetcher, SimpleTiebaDownloader
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    /close  回复后直接断开连接（不发送 Connection: close，模拟服务器关闭空闲连接）
+    /slow   先发送响应头，过一会儿才发送正文
+    其它路径回复路径本身
+    """
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        body = self.path.encode('utf-8')
+        self.server.ports.append(self.client_address[1])
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.path == '/slow':
+            self.wfile.flush()
+            time.sleep(1)
+        self.wfile.write(body)
+        if self.path == '/close':
+            self.close_connection = True
+    
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.ports = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetcher_for(server, timeout=5):
+    return HttpFetcher([], base_url=f"http://127.0.0.1:{server.server_address[1]}", timeout=timeout)
+
+
+def test_keep_alive_reused(server):
+    """同一线程的请求复用同一个连接"""
+    fetcher = fetcher_for(server)
+    assert fetcher.get('/p/1') == (200, '/p/1')
+    assert fetcher.get('/p/2') == (200, '/p/2')
+    assert len(set(server.ports)) == 1
+    fetcher.close()
+
+
+def test_reconnect_after_server_close(server):
+    """服务器关闭空闲连接后自动重连"""
+    fetcher = fetcher_for(server)
+    assert fetcher.get('/close') == (200, '/close')
+    assert fetcher.get('/p/1') == (200, '/p/1')
+    assert len(set(server.ports)) == 2
+    fetcher.close()
+
+
+def test_reconnect_after_timeout(server):
+    """读取正文超时后丢弃连接，下一次请求不会读到上一个响应剩下的内容"""
+    fetcher = fetcher_for(server, timeout=0.3)
+    with pytest.raises(socket.timeout):
+        fetcher.get('/slow')
+    assert fetcher.local.conn is None
+    assert fetcher.get('/p/1') == (200, '/p/1')
+    fetcher.close()
+
+
+class NoLimit:
+    """不限速、不退避的速率控制"""
+    
+    def wait(self):
+        pass
+    
+    def report(self, status, load_time):
+        return 0
+    
+    def current_rate(self):
+        return 0.0
+    
+    def effective_rate(self):
+        return 0.0
+
+
+def test_parallel_worker_survives_fetch_error():
+    """下载函数抛出异常时该任务记为失败，其他线程照常结束，不会一直等待"""
+    downloader = SimpleTiebaDownloader.__new__(SimpleTiebaDownloader)
+    downloader.discovered = queue.Queue()
+    downloader.print_lock = threading.Lock()
+    
+    def fetch(url):
+        if url.endswith('/bad'):
+            raise OSError("磁盘已满")
+        return 'ok', "✓"
+    
+    urls = ['/p/1', '/bad', '/p/2', '/p/3']
+    result = []
+    thread = threading.Thread(target=lambda: result.append(
+        downloader.download_parallel(urls, [fetch, fetch], NoLimit())), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert result == [(3, 1)]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+HTML转TXT脚本 html_to_txt_v2.py 的测试
+运行: python -m pytest
+"""
+
+import io
+import json
+import shutil
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+CONVERTER_DIR = ROOT / "scripts" / "批量导出主题帖为TXT" / "HTML_to_TXT"
+EXAMPLE_HTML = ROOT / "examples" / "00_HTMLs" / "6127095737.html"
+
+sys.path.insert(0, str(CONVERTER_DIR))
+import html_to_txt_v2 as converter
+
+
+def test_jsonl_without_lxml(tmp_path, monkeypatch):
+    """未安装lxml时，auto / lean 方式的楼层记录改用 html.parser"""
+    monkeypatch.setattr(converter, "lxml_available", lambda: False)
+    for parser in ('auto', 'lean'):
+        output_dir = tmp_path / parser
+        output_dir.mkdir()
+        assert converter.parse_html_file(EXAMPLE_HTML, output_dir, parser=parser, output_format='jsonl')
+        lines = (output_dir / "6127095737.jsonl").read_text(encoding="utf-8").splitlines()
+        assert lines
+        assert all(json.loads(line) for line in lines)
+
+
+def test_deleted_marker_in_script_is_not_dead():
+    """正常帖子的内嵌脚本中出现删除提示时，各解析方式仍然正常转换"""
+    html, _ = converter.read_html(EXAMPLE_HTML)
+    scripted = html.replace('</head>', '<script>var tip = "该贴已被删除";</script></head>', 1)
+    assert not converter.is_dead_page(scripted)
+    assert not converter.is_dead_page(scripted.encode('utf-8'))
+    for parser in converter.PARSER_BACKENDS:
+        if converter.resolve_parser(parser) != parser:
+            continue
+        expected = converter.convert_html(html, parser=parser)
+        assert expected is not None
+        assert converter.convert_html(scripted, parser=parser) == expected
+    
+    out = io.StringIO()
+    assert converter.stream_floors([scripted], out)[0] is not None
+
+
+def test_dead_pages():
+    """标题中有404、或页面文本中有删除提示的页面返回 None"""
+    html, _ = converter.read_html(EXAMPLE_HTML)
+    deleted = html.replace('<body', '<div>该贴已被删除</div><body', 1)
+    not_found = '<html><head><title>404 - 百度贴吧</title></head><body></body></html>'
+    for page in (deleted, not_found):
+        assert converter.is_dead_page(page)
+        assert converter.is_dead_page(page.encode('gb18030'))
+        for parser in converter.PARSER_BACKENDS:
+            if converter.resolve_parser(parser) == parser:
+                assert converter.convert_html(page, parser=parser) is None
+    
+    # 删除提示被分在两块中
+    middle = deleted.index('该贴已被删除') + 3
+    assert converter.stream_floors([deleted[:middle], deleted[middle:]], io.StringIO())[0] is None
+
+
+def test_manifest_tracks_dead_page(tmp_path, monkeypatch, capsys):
+    """修改共用的 dead_page.py 后，上次的转换结果全部作废"""
+    input_dir = tmp_path / "html"
+    input_dir.mkdir()
+    shutil.copy(EXAMPLE_HTML, input_dir)
+    dead_page = tmp_path / "dead_page.py"
+    shutil.copy(converter.DEAD_PAGE_PATH, dead_page)
+    monkeypatch.setattr(converter, "DEAD_PAGE_PATH", dead_page)
+    output_dir = tmp_path / "txt"
+    
+    converter.batch_convert(input_dir, output_dir)
+    converter.batch_convert(input_dir, output_dir)
+    assert "未变化: 1 个帖子" in capsys.readouterr().out
+    
+    dead_page.write_text(dead_page.read_text(encoding="utf-8") + "\n# 新的删除提示\n", encoding="utf-8")
+    converter.batch_convert(input_dir, output_dir)
+    out = capsys.readouterr().out
+    assert "全部重新处理" in out
+    assert "未变化" not in out
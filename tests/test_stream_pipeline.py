@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+流水线 stream_pipeline.py 的测试（不联网，不打开浏览器）
+运行: python -m pytest
+"""
+
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("selenium")
+
+ROOT = Path(__file__).resolve().parent.parent
+DOWNLOAD_DIR = ROOT / "scripts" / "批量导出主题帖为TXT" / "HTML_Download"
+EXAMPLES = ROOT / "examples"
+
+sys.path.insert(0, str(DOWNLOAD_DIR))
+import stream_pipeline
+from stream_pipeline import ThreadFileWriter
+
+
+def test_pages_wait_for_first_page(tmp_path):
+    """后续分页先到时暂存，首页写出后按页码顺序放出，并带上首页的吧名"""
+    writer = ThreadFileWriter(tmp_path)
+    assert writer.add("1", 3, "三") == []
+    assert writer.add("1", 2, "二") == []
+    assert not (tmp_path / "1.txt").exists()
+    
+    assert writer.add("1", 1, "一", bar="三体") == [(1, "一", "三体"), (2, "二", "三体"), (3, "三", "三体")]
+    assert writer.add("1", 4, "四") == [(4, "四", "三体")]
+    assert (tmp_path / "1.txt").read_text(encoding="utf-8") == "一二三四"
+
+
+def test_missing_first_page_not_appended(tmp_path):
+    """本次没有收到首页的帖子不接在旧文件后面，交给调用方从已保存的页面重建"""
+    (tmp_path / "1.txt").write_text("上次的结果", encoding="utf-8")
+    writer = ThreadFileWriter(tmp_path)
+    writer.add("1", 2, "二")
+    writer.add("1", 3, "三")
+    
+    assert writer.close() == ([], ["1"])
+    assert (tmp_path / "1.txt").read_text(encoding="utf-8") == "上次的结果"
+
+
+def test_skipped_first_page_drops_thread(tmp_path):
+    """首页被跳过（404等）的帖子整个不输出"""
+    writer = ThreadFileWriter(tmp_path)
+    assert writer.add("1", 1, None) == []
+    assert writer.add("1", 2, "二") == []
+    assert writer.close() == ([], [])
+    assert not (tmp_path / "1.txt").exists()
+
+
+def test_gap_flushed_on_close(tmp_path):
+    """中间分页下载失败时，结束时跳过它写出后面的页面"""
+    writer = ThreadFileWriter(tmp_path)
+    writer.add("1", 1, "一", bar="三体")
+    writer.add("1", 3, "三")
+    assert writer.close() == ([("1", 3, "三", "三体")], [])
+    assert (tmp_path / "1.txt").read_text(encoding="utf-8") == "一三"
+
+
+class FakeDownloader:
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+
+
+def test_rebuild_thread_matches_batch_scripts(tmp_path):
+    """首页在之前的运行中下载的帖子，从已保存的HTML重建，结果与流水线逐页处理相同"""
+    html_dir = tmp_path / "html"
+    html_dir.mkdir()
+    shutil.copy(EXAMPLES / "00_HTMLs" / "6127095737.html", html_dir)
+    
+    pipeline = stream_pipeline.StreamPipeline.__new__(stream_pipeline.StreamPipeline)
+    pipeline.converter = stream_pipeline.load_module("html_to_txt_v2", stream_pipeline.CONVERTER_PATH)
+    pipeline.cleaner = stream_pipeline.load_module("tieba_text_cleanerV2", stream_pipeline.CLEANER_PATH)
+    pipeline.patterns = pipeline.cleaner.load_rules()
+    pipeline.downloader = FakeDownloader(html_dir)
+    pipeline.txt_writer = ThreadFileWriter(tmp_path / "txt")
+    pipeline.cleaned_writer = ThreadFileWriter(tmp_path / "cleaned")
+    
+    assert pipeline.rebuild_thread("6127095737")
+    html, _ = pipeline.converter.read_html(html_dir / "6127095737.html")
+    text = pipeline.convert(1, html)
+    assert (tmp_path / "txt" / "6127095737.txt").read_text(encoding="utf-8") == text
+    expected = pipeline.cleaner.clean_text(text, pipeline.patterns)
+    assert (tmp_path / "cleaned" / "6127095737.txt").read_text(encoding="utf-8") == expected
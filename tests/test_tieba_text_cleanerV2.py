@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+关键词清洗脚本 tieba_text_cleanerV2.py 的测试
+运行: python -m pytest
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+CLEANER_DIR = ROOT / "scripts" / "关键词清洗" / "02_clearerV2"
+CLEANER = CLEANER_DIR / "tieba_text_cleanerV2.py"
+EXAMPLES = ROOT / "examples" / "01_original_txt"
+
+sys.path.insert(0, str(CLEANER_DIR))
+import tieba_text_cleanerV2 as cleaner
+
+
+def test_profile_rules_cli(tmp_path):
+    """--profile-rules 能统计示例文件并写出JSON报告"""
+    report_path = tmp_path / "rule_profile.json"
+    result = subprocess.run(
+        [sys.executable, str(CLEANER), "-i", str(EXAMPLES), "--profile-rules", "--report", str(report_path)],
+        capture_output=True, text=True, encoding="utf-8")
+    assert result.returncode == 0, result.stderr
+    
+    report = json.loads(report_path.read_text(encoding="utf-8"))
+    assert report["files"] == len(list(EXAMPLES.glob("*.txt")))
+    assert len(report["rules"]) == len(cleaner.load_rules())
+    assert any(rule["matches"] for rule in report["rules"])
+    assert all(rule["files"] == report["files"] for rule in report["rules"])
+
+
+def test_new_stats():
+    patterns = cleaner.load_rules()
+    stats = patterns.new_stats()
+    assert len(stats) == len(patterns)
+    patterns.clean("看贴 图片 吧主推荐", stats=stats)
+    assert sum(stat["matches"] for stat in stats) > 0
+
+
+def test_compile_before_profiling():
+    """compile 立即编译规则用到的全部正则，统计耗时时第一次匹配不再包含编译时间"""
+    rule = cleaner.ReplacementRule(r'\d+[\u4e00-\u9fa5\s]{5,60}\d{5,}')
+    rule.compile()
+    assert rule._regex is not None
+    assert rule.linear_checked
+    assert rule.replace("12你好世界你好123456 ok")[1] == 1
+    # RE2 字符范围只缓存结果，不保留全部字符组成的字符串
+    if rule.linear is not None:
+        assert len(cleaner._category_ranges) == len(cleaner.CATEGORY_CLASSES)
+    assert not hasattr(cleaner, "_all_chars")
+
+
+def write_rule_file(directory, rules):
+    path = directory / "test.json"
+    path.write_text(json.dumps({"format": 1, "rules": rules}, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def test_invalid_rules_skipped(tmp_path):
+    """无效的规则被跳过，其余规则照常加载"""
+    path = write_rule_file(tmp_path, [
+        {"type": "regex", "pattern": "[未闭合"},
+        {"type": "unknown", "pattern": "关键词"},
+        {"pattern": ""},
+        "有效关键词",
+    ])
+    rules, source = cleaner.read_rule_file(path)
+    assert [rule[1] for rule in rules] == [cleaner.re.escape("有效关键词")]
+
+
+def test_zero_width_rules_skipped(tmp_path):
+    """可能匹配空串的正则被当作无效规则跳过"""
+    path = write_rule_file(tmp_path, [
+        {"type": "regex", "pattern": "a*"},
+        {"type": "regex", "pattern": r"\d?"},
+        {"type": "regex", "pattern": "(?=x)"},
+        {"type": "regex", "pattern": r"\d+"},
+    ])
+    rules, source = cleaner.read_rule_file(path)
+    assert [rule[1] for rule in rules] == [r"\d+"]
+    
+    engine = cleaner.load_rules(tmp_path)
+    assert engine.clean("abc") == "abc"